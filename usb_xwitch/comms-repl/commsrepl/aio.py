@@ -0,0 +1,141 @@
+import asyncio
+import serial
+from serial.tools import list_ports
+from .serialrepl import parse_reply, INPUT_SIGN, RX_Q_LINES_TIMEOUT, RX_READ_SIZE, CTRL_C, RESYNC_QUIET
+
+PICO_VID = 0x2E8A  # Raspberry Pi USB vendor id
+
+
+class AsyncREPL(object):
+    """
+    asyncio REPL client. Serial port read from the event loop (loop.add_reader), no thread per board. posix only
+    """
+    def __init__(self, port_name: str, baud=115200, serial_no=None):
+        self.port_name = port_name
+        self.baud = baud
+        self.serial_no = serial_no
+        self.serial = None
+        self._buf = bytearray()
+        self._prompt = None  # future resolved when prompt received during a call
+        self._lock = asyncio.Lock()  # one command in flight per board
+        self._dirty = False  # a call timed out, its late output may still arrive
+
+    async def open(self) -> 'AsyncREPL':
+        self.serial = serial.Serial(self.port_name, baudrate=self.baud, timeout=0)
+        asyncio.get_running_loop().add_reader(self.serial.fileno(), self._on_readable)
+        return self
+
+    def _on_readable(self) -> None:
+        try:
+            data = self.serial.read(max(1, min(self.serial.in_waiting, RX_READ_SIZE)))
+        except (serial.SerialException, OSError) as e:
+            if self._prompt is not None and not self._prompt.done():
+                self._prompt.set_exception(e)
+            return
+        self._buf += data
+        if self._prompt is not None and not self._prompt.done() and INPUT_SIGN in self._buf:
+            self._prompt.set_result(None)
+
+    async def call(self, expr: str, timeout=RX_Q_LINES_TIMEOUT):
+        """
+        evaluate expression on board and return its parsed result, see SerialREPL.call
+        """
+        async with self._lock:
+            if self._dirty:
+                await self._resync(timeout)
+            self._buf.clear()
+            self._prompt = asyncio.get_running_loop().create_future()
+            self.serial.write(f'{expr}\r\n'.encode())
+            try:
+                await asyncio.wait_for(self._prompt, timeout)
+            except asyncio.TimeoutError:
+                self._dirty = True
+                raise TimeoutError(f'{self.port_name}: no REPL prompt within {timeout}s after: {expr}')
+            finally:
+                self._prompt = None
+            end = self._buf.find(INPUT_SIGN)
+            reply = bytes(self._buf[:end])
+            del self._buf[:end + len(INPUT_SIGN)]
+        return parse_reply(reply)
+
+    async def _resync(self, timeout: float) -> None:
+        """
+        interrupt the board and drain to an idle prompt after a timed out call, see SerialREPL._resync
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        self._buf.clear()
+        self.serial.write(CTRL_C)
+        size = -1
+        while not (self._buf.endswith(INPUT_SIGN) and len(self._buf) == size):
+            if loop.time() >= deadline:
+                raise TimeoutError(f'{self.port_name}: REPL not back to an idle prompt within {timeout}s')
+            size = len(self._buf)
+            await asyncio.sleep(RESYNC_QUIET)
+        self._buf.clear()
+        self._dirty = False
+
+    async def close(self) -> None:
+        if self.serial is None:
+            return
+        asyncio.get_running_loop().remove_reader(self.serial.fileno())
+        self.serial.close()
+        self.serial = None
+
+
+class Fleet(object):
+    """
+    many xwitch root boards driven concurrently. Boards keyed by USB serial number, commands run on all boards at once
+    e.g.:
+        >>> fleet = await Fleet().open()
+        >>> await fleet.call('set_switch(1)')  # every board switched within one round trip
+        {'E6614C311B4A8F2C': None, 'E6614C311B6B3D29': None}
+    """
+    def __init__(self, serials=None, baud=115200):
+        """
+        :param serials: USB serial numbers to open, None for every pico found
+        """
+        self.serials = serials
+        self.baud = baud
+        self.boards = {}
+
+    @staticmethod
+    def discover(vid=PICO_VID) -> dict:
+        """
+        connected boards as {USB serial number: port device}
+        """
+        return {p.serial_number: p.device for p in list_ports.comports() if p.vid == vid and p.serial_number}
+
+    async def open(self) -> 'Fleet':
+        found = self.discover()
+        serials = found.keys() if self.serials is None else self.serials
+        missing = [sn for sn in serials if sn not in found]
+        if missing:
+            raise IOError(f'boards not connected: {missing}')
+        for sn in serials:
+            if sn not in self.boards:
+                self.boards[sn] = await AsyncREPL(found[sn], self.baud, sn).open()
+        return self
+
+    async def call(self, expr: str, timeout=RX_Q_LINES_TIMEOUT, serials=None) -> dict:
+        """
+        run expression on boards (all by default) concurrently, each with its own timeout.
+        return {serial number: result}, a board failing or timing out holds its exception instead
+        """
+        serials = list(self.boards) if serials is None else serials
+        results = await asyncio.gather(*[self.boards[sn].call(expr, timeout) for sn in serials],
+                                       return_exceptions=True)
+        return dict(zip(serials, results))
+
+    async def call_each(self, exprs: dict, timeout=RX_Q_LINES_TIMEOUT) -> dict:
+        """
+        run a different expression per board concurrently, exprs as {serial number: expression}
+        """
+        results = await asyncio.gather(*[self.boards[sn].call(expr, timeout) for sn, expr in exprs.items()],
+                                       return_exceptions=True)
+        return dict(zip(exprs, results))
+
+    async def close(self) -> None:
+        for board in self.boards.values():
+            await board.close()
+        self.boards = {}
@@ -0,0 +1,44 @@
+import argparse
+import sys
+from .daemon import Daemon, Client, SOCKET_PATH
+
+
+def main(argv=None) -> int:
+    """
+    xwitch command line.
+    e.g.:
+        xwitch daemon &
+        xwitch /dev/ttyACM0 'set_switch(1)'
+        xwitch E6614C311B4A8F2C 'get_hubs()'
+    """
+    parser = argparse.ArgumentParser(prog='xwitch', description='usb-xwitch board commands through xwitch daemon')
+    parser.add_argument('--socket', default=SOCKET_PATH, help='daemon unix socket path')
+    parser.add_argument('--timeout', type=float, default=3, help='command timeout in seconds')
+    parser.add_argument('--fresh', action='store_true', help='bypass cached chain state')
+    parser.add_argument('port', help="board port device or USB serial number, or 'daemon' to run the daemon")
+    parser.add_argument('expr', nargs='?', help='expression to run on board, e.g. "get_hubs()"')
+    args = parser.parse_args(argv)
+    if args.port == 'daemon':
+        try:
+            Daemon(args.socket).serve_forever()
+        except OSError as e:  # another daemon serving
+            print(e, file=sys.stderr)
+            return 1
+        return 0
+    if args.expr is None:
+        parser.error('expr required')
+    client = Client(args.socket)
+    try:
+        result = client.call(args.port, args.expr, args.timeout, args.fresh)
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        client.close()
+    if result is not None:
+        print(result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import ast
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+import serial
+from .serialrepl import SerialREPL, REPLError, RX_Q_LINES_TIMEOUT
+from .aio import Fleet
+
+SOCKET_PATH = '/tmp/xwitch.sock'
+CACHE_TTL = 5  # seconds a cached chain state read is served without asking the board
+CACHED = ('get_hub()', 'get_hubs()', 'get_switch()', 'get_switches()')  # read only, served from cache
+ENCODING = 'utf-8'
+
+
+class Board(object):
+    """
+    one serial session, commands serialised by lock, chain state reads cached until a command changes the board
+    """
+    def __init__(self, port_name: str, baud=115200):
+        self.device = port_name
+        self.repl = SerialREPL(port_name, baud)
+        self.lock = threading.Lock()
+        self.cache = {}  # expression: (time, result)
+
+    def call(self, expr: str, timeout=RX_Q_LINES_TIMEOUT, fresh=False):
+        with self.lock:
+            if expr in CACHED and not fresh:
+                hit = self.cache.get(expr)
+                if hit is not None and time.monotonic() - hit[0] < CACHE_TTL:
+                    return hit[1]
+            if expr not in CACHED:
+                self.cache.clear()  # anything else may have changed hubs or switches
+            result = self.repl.call(expr, timeout)
+            if expr in CACHED:
+                self.cache[expr] = (time.monotonic(), result)
+            return result
+
+    def close(self) -> None:
+        self.repl.close()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """
+    one JSON request per line: {"port": port or USB serial no, "expr": expression, "timeout": s, "fresh": bool}
+    reply per line: {"ok": true, "result": repr of result} or {"ok": false, "error": type, "message": str}
+    """
+    def handle(self):
+        for line in self.rfile:
+            try:
+                req = json.loads(line)
+                result = self.server.daemon.call(req['port'], req['expr'], req.get('timeout', RX_Q_LINES_TIMEOUT),
+                                                 req.get('fresh', False))
+                rep = {'ok': True, 'result': repr(result)}
+            except Exception as e:
+                rep = {'ok': False, 'error': type(e).__name__, 'message': str(e)}
+            self.wfile.write(json.dumps(rep).encode(ENCODING) + b'\n')
+
+
+class Daemon(object):
+    """
+    long running owner of board serial ports, serving local clients over a Unix domain socket
+    """
+    def __init__(self, socket_path=SOCKET_PATH, baud=115200):
+        self.socket_path = socket_path
+        self.baud = baud
+        self.boards = {}  # device path: Board
+        self.ports = {}  # port or USB serial number asked for: device path, resolved once
+        self.b_lock = threading.Lock()
+        self.server = None
+
+    def board(self, port: str) -> Board:
+        """
+        get or open a board session by port device or USB serial number.
+        sessions keyed by the resolved device path, so both names of one board share its serial port. A name is
+        resolved (USB enumerated) only the first time, or again once its session was dropped
+        """
+        with self.b_lock:
+            device = self.ports.get(port)
+            if device is None:
+                device = os.path.realpath(Fleet.discover().get(port, port))
+            if device not in self.boards:
+                self.boards[device] = Board(device, self.baud)
+            self.ports[port] = device
+            return self.boards[device]
+
+    def drop(self, board: Board) -> None:
+        """
+        close a session whose serial port failed (board unplugged), a re-plugged board gets a fresh one
+        """
+        with self.b_lock:
+            if self.boards.get(board.device) is board:
+                del self.boards[board.device]
+            for port in [port for port, device in self.ports.items() if device == board.device]:
+                del self.ports[port]
+        board.close()
+
+    def call(self, port: str, expr: str, timeout=RX_Q_LINES_TIMEOUT, fresh=False):
+        board = self.board(port)
+        try:
+            return board.call(expr, timeout, fresh)
+        except serial.SerialException:
+            self.drop(board)
+            raise
+
+    @staticmethod
+    def serving(socket_path=SOCKET_PATH) -> bool:
+        """
+        True when a daemon answers on socket_path, False for no socket or a stale one left by a dead daemon
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path)
+            return True
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+        finally:
+            sock.close()
+
+    def serve_forever(self) -> None:
+        if self.serving(self.socket_path):
+            raise OSError(f'daemon already serving on {self.socket_path}')
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # stale socket of a previous daemon
+        self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, _Handler)
+        self.server.daemon_threads = True
+        self.server.daemon = self
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self.server is not None:
+            self.server.server_close()
+            self.server = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        for board in self.boards.values():
+            board.close()
+        self.boards = {}
+        self.ports = {}
+
+
+class Client(object):
+    """
+    daemon client, keeps one socket connection for repeated calls
+    e.g.:
+        >>> Client().call('/dev/ttyACM0', 'get_hubs()')
+        {0: [True, True, True], 1: [False, True, True, True]}
+    """
+    def __init__(self, socket_path=SOCKET_PATH):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.rfile = self.sock.makefile('rb')
+
+    def call(self, port: str, expr: str, timeout=RX_Q_LINES_TIMEOUT, fresh=False):
+        req = {'port': port, 'expr': expr, 'timeout': timeout, 'fresh': fresh}
+        self.sock.sendall(json.dumps(req).encode(ENCODING) + b'\n')
+        rep = json.loads(self.rfile.readline())
+        if not rep['ok']:
+            raise REPLError(f"{rep['error']}: {rep['message']}")
+        try:
+            return ast.literal_eval(rep['result'])
+        except (ValueError, SyntaxError):
+            return rep['result']
+
+    def close(self) -> None:
+        self.rfile.close()
+        self.sock.close()
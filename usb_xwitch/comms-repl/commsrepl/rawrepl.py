@@ -0,0 +1,166 @@
+import serial
+import struct
+import ast
+import time
+from .serialrepl import REPLError
+
+RX_TIMEOUT = 3  # Max expected command execution time on board, seconds
+CTRL_A = b'\x01'  # enter raw REPL
+CTRL_B = b'\x02'  # exit raw REPL
+CTRL_C = b'\x03'
+CTRL_D = b'\x04'  # end of data / stdout / stderr
+CTRL_E = b'\x05'
+RAW_PROMPT = b'raw REPL; CTRL-B to exit\r\n>'
+RAW_PASTE = CTRL_E + b'A' + CTRL_A
+RAW_PASTE_OK = b'R\x01'
+RAW_PASTE_NO = b'R\x00'
+# pico rpc.py result frame: marker, status, 8 hex digits length, repr payload
+FRAME = b'\x02'
+FRAME_OK = b'R'
+FRAME_ERR = b'E'
+FRAME_HDR_LEN = 10
+
+
+class RawREPL(object):
+    """
+    MicroPython raw REPL transport. Code is sent in raw-paste mode with device flow control (plain raw mode on firmware
+    without it), no echo, stdout and stderr come back delimited by CTRL-D
+    """
+    def __init__(self, port_name: str, baud=115200, rpc=True):
+        self.serial = serial.Serial(port_name, baudrate=baud, timeout=RX_TIMEOUT)
+        self.raw_paste = True
+        self.enter_raw()
+        self.rpc_loaded = False
+        if rpc:
+            self.load_rpc()
+
+    def _read_until(self, marker: bytes, timeout=RX_TIMEOUT) -> bytes:
+        """
+        read until marker received, return data before marker
+        """
+        data = bytearray()
+        deadline = time.monotonic() + timeout
+        while not data.endswith(marker):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'raw REPL: {marker} not received within {timeout}s, got: {bytes(data[-64:])}')
+            data += self.serial.read(max(1, min(self.serial.in_waiting, len(marker))))
+        return bytes(data[:-len(marker)])
+
+    def enter_raw(self) -> None:
+        self.serial.write(b'\r' + CTRL_C + CTRL_C)  # stop running program
+        time.sleep(0.05)
+        self.serial.reset_input_buffer()
+        self.serial.write(b'\r' + CTRL_A)
+        self._read_until(RAW_PROMPT)
+
+    def exit_raw(self) -> None:
+        self.serial.write(CTRL_B)
+
+    def _paste(self, code: bytes) -> None:
+        """
+        send code in raw-paste mode, honouring device window. Falls back to raw mode once device refuses raw-paste:
+        R\x00 when it knows the command but lacks support, anything else from firmware predating it, which then
+        re-sends the raw REPL banner
+        """
+        if self.raw_paste:
+            self.serial.write(RAW_PASTE)
+            resp = self.serial.read(2)
+            if resp == RAW_PASTE_OK:
+                window = struct.unpack('<H', self.serial.read(2))[0]
+                remaining = window
+                i = 0
+                while i < len(code):
+                    flow = None
+                    while remaining == 0 or self.serial.in_waiting:
+                        flow = self.serial.read(1)
+                        if flow == CTRL_A:
+                            remaining += window
+                        elif flow == CTRL_D:  # device ended paste early: ack once, it compiles what it got
+                            self.serial.write(CTRL_D)
+                            return
+                        elif not flow:
+                            raise TimeoutError('raw REPL: raw-paste flow control stalled')
+                    n = min(remaining, len(code) - i)
+                    self.serial.write(code[i:i + n])
+                    remaining -= n
+                    i += n
+                self.serial.write(CTRL_D)  # whole script sent
+                self._read_until(CTRL_D)  # device acknowledges end of data
+                return
+            if resp != RAW_PASTE_NO:  # raw-paste unknown to firmware, raw REPL banner follows
+                self._read_until(RAW_PROMPT[2:])  # its start may be in resp already
+            self.raw_paste = False
+        self.serial.write(code + CTRL_D)
+        resp = self.serial.read(2)
+        if resp != b'OK':
+            raise REPLError(f'raw REPL: code not accepted: {resp}')
+
+    def exec(self, code: str, timeout=RX_TIMEOUT) -> bytes:
+        """
+        execute code on board, return stdout. Board exception raised as REPLError
+        """
+        self._paste(code.encode())
+        out = self._read_until(CTRL_D, timeout)
+        err = self._read_until(CTRL_D, timeout)
+        self._read_until(b'>', timeout)
+        if err:
+            raise REPLError(err.decode(errors='replace').rstrip('\r\n'))
+        return out
+
+    def eval(self, expr: str, timeout=RX_TIMEOUT):
+        """
+        evaluate expression on board, result parsed by ast.literal_eval
+        """
+        return self._frame(self.exec(f'rpc.reply({expr})' if self.rpc_loaded else f'print(repr({expr}))', timeout))
+
+    def load_rpc(self) -> bool:
+        """
+        import on board rpc dispatcher (pico/rpc.py) once, plain expression evaluation when not copied to board
+        """
+        try:
+            self.exec('import rpc')
+            self.rpc_loaded = True
+        except REPLError:
+            self.rpc_loaded = False
+        return self.rpc_loaded
+
+    def rpc(self, name: str, *args, timeout=RX_TIMEOUT):
+        """
+        call a main.py function through on board rpc dispatcher
+        e.g.:
+            >>> raw.rpc('set_hub', [True, False, True, True])
+            >>> raw.rpc('get_hubs')
+            {0: [True, False, True], 1: [True, True, True, True]}
+        """
+        if not self.rpc_loaded:
+            raise REPLError('rpc.py not found on board')
+        call_args = ''.join(f', {a!r}' for a in args)
+        return self._frame(self.exec(f'rpc.call({name!r}{call_args})', timeout))
+
+    def _frame(self, out: bytes):
+        """
+        parse a length framed rpc result, repr payload. Anything printed before the frame is skipped
+        """
+        start = out.rfind(FRAME)
+        if start < 0:  # plain print(repr()) output
+            text = out.decode(errors='replace').rstrip('\r\n')
+            return ast.literal_eval(text) if text else None
+        hdr = out[start:start + FRAME_HDR_LEN]
+        length = int(hdr[2:], 16)
+        payload = out[start + FRAME_HDR_LEN:start + FRAME_HDR_LEN + length]
+        if len(payload) != length:
+            raise REPLError(f'rpc frame truncated: {length} bytes expected, {len(payload)} received')
+        if hdr[1:2] == FRAME_ERR:
+            raise REPLError(payload.decode(errors='replace'))
+        return ast.literal_eval(payload.decode())
+
+    def close(self) -> None:
+        if self.serial.isOpen():
+            try:
+                self.exit_raw()
+            except (serial.SerialException, OSError, TypeError):  # port gone, or interpreter shutting down
+                pass
+        self.serial.close()
+
+    def __del__(self):
+        self.close()
@@ -1,77 +1,144 @@
 import serial
-from threading import Thread, Event
+from threading import Thread, Condition
 from queue import deque
+import ast
 import time
 
 RX_Q_LINES_TIMEOUT = 3  # Max expected return lines timeout from REPL
+RX_READ_TIMEOUT = 0.05  # serial read blocks up to this when idle, seconds
+RX_READ_SIZE = 4096
+RX_Q_LEN = 1024  # output lines kept from outside call(), oldest dropped beyond
 EOL = bytes('\r\n'.encode())
 END = '>>> '
 CR = bytes('\r'.encode())
 NL = bytes('\n'.encode())
 INPUT_SIGN = bytes('>>> '.encode())
+TRACEBACK = b'Traceback (most recent call last):'
+CTRL_C = b'\x03'
+RESYNC_QUIET = 0.1  # no output for this long after a prompt means REPL idle again, seconds
+
+
+class REPLError(Exception):
+    """
+    exception raised on board while executing a call, message is the board traceback
+    """
+    pass
+
+
+def parse_reply(reply: bytes):
+    """
+    parse friendly REPL output of one command up to the prompt: strip echoed command line, raise board exception,
+    literal_eval the result
+    """
+    out = reply.split(EOL, 1)[1] if EOL in reply else b''
+    out = out.decode(errors='replace').rstrip('\r\n')
+    if out.startswith(TRACEBACK.decode()):
+        raise REPLError(out)
+    if not out:
+        return None
+    try:
+        return ast.literal_eval(out)
+    except (ValueError, SyntaxError):
+        return out
 
 
 class SerialREPL(object):
     def __init__(self, port_name: str, baud=115200):
-        self.serial = serial.Serial(port_name, baudrate=baud, timeout=0)
+        self.serial = serial.Serial(port_name, baudrate=baud, timeout=RX_READ_TIMEOUT)
         if not self.serial.isOpen():
             self.serial.open()
-        self.rx_queue = deque(maxlen=10)
-        self.rx_th = Thread(target=self.__rx_thread, args=())
+        self.rx_queue = deque(maxlen=RX_Q_LEN)  # output lines received outside call()
+        self.rx_dropped = 0  # lines dropped from a full rx_queue, never read
+        self._buf = bytearray()  # received and not yet consumed
+        self._cond = Condition()
+        self._calling = False
+        self._dirty = False  # a call timed out, its late output may still arrive
+        self.rx_th = Thread(target=self.__rx_thread, args=(), daemon=True)
         self.rx_th.start()
 
-    def __is_cr_nl_consecutive(self, income_byte: bytes) -> bool:
+    def __split_lines(self) -> None:
         """
-        check if \r\n received in sequence. i.e. end of a return text line
-        :param income_byte:
+        move complete lines and input signs out of receive buffer into rx_queue, oldest dropped when full
         """
-        self._eol_bytes += income_byte
-        if len(self._eol_bytes) < 2:
-            return False
-        elif len(self._eol_bytes) == 2:
-            if self._eol_bytes == EOL:
-                self._eol_bytes = bytes()
-                return True
-            else:
-                self._eol_bytes = bytes()
-                return False
-        else:
-            self._eol_bytes = bytes()
-            return False
+        while True:
+            eol = self._buf.find(EOL)
+            sign = self._buf.find(INPUT_SIGN)
+            if eol < 0 and sign < 0:
+                return
+            end = eol + len(EOL) if sign < 0 or 0 <= eol < sign else sign + len(INPUT_SIGN)
+            if len(self.rx_queue) == RX_Q_LEN:
+                self.rx_dropped += 1
+            self.rx_queue.append(bytes(self._buf[:end]))
+            del self._buf[:end]
 
-    def __is_input_sign(self, income_byte: bytes) -> bool:
+    def __rx_thread(self):
         """
-        check if a python input sign received. i.e. >>> sign received. normally indicates that REPL finished text return
-        :param income_byte:
+        Serial communication receive handling thread. Reads in bulk, blocking up to RX_READ_TIMEOUT when idle
         """
-        self._input_sign_bytes += income_byte
-        if self._input_sign_bytes == INPUT_SIGN:
-            self._input_sign_bytes = bytes()
-            return True
-        elif len(self._input_sign_bytes) > len(INPUT_SIGN):
-            self._input_sign_bytes = bytes()
-            return False
-        return False
+        while self.serial.isOpen():
+            try:
+                data = self.serial.read(max(1, min(self.serial.in_waiting, RX_READ_SIZE)))
+            except (serial.SerialException, TypeError, OSError):  # port closed meanwhile
+                break
+            if not data:
+                continue
+            with self._cond:
+                self._buf += data
+                if not self._calling:
+                    self.__split_lines()
+                self._cond.notify_all()
 
-    def __rx_thread(self):
+    def call(self, expr: str, timeout=RX_Q_LINES_TIMEOUT):
         """
-        Serial communication receive handling thread
+        evaluate expression on board and return its result. Python literals (numbers, lists, dicts, tuples, bools, None)
+        are parsed, other output returned as str. Board exception raised as REPLError
+        e.g.:
+            >>> repl.call('get_hubs()')
+            {0: [True, True, True], 1: [False, True, True, True]}
         """
-        while self.serial.isOpen():
-            if self.serial.inWaiting() > 0:
-                ts = time.time()
-                line_byte = bytes()
-                self._eol_bytes = bytes()
-                self._input_sign_bytes = bytes()
-                while time.time() - ts < RX_Q_LINES_TIMEOUT and self.serial.inWaiting() > 0:
-                    byte_read = self.serial.read()
-                    line_byte += byte_read
-                    if byte_read in [CR, NL] and self.__is_cr_nl_consecutive(byte_read):
-                        self.rx_queue.append(line_byte)
-                        break
-                    if byte_read in INPUT_SIGN and self.__is_input_sign(byte_read):
-                        self.rx_queue.append(line_byte)
-                        break
+        with self._cond:
+            self._calling = True
+            self.__split_lines()  # output so far belongs to rx_queue
+            self._buf.clear()
+        try:
+            if self._dirty:
+                self._resync(timeout)
+            self.send(expr)
+            deadline = time.monotonic() + timeout
+            with self._cond:
+                while INPUT_SIGN not in self._buf:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._dirty = True
+                        raise TimeoutError(f'no REPL prompt within {timeout}s after: {expr}')
+                    self._cond.wait(remaining)
+                end = self._buf.find(INPUT_SIGN)
+                reply = bytes(self._buf[:end])
+                del self._buf[:end + len(INPUT_SIGN)]
+        finally:
+            with self._cond:
+                self._calling = False
+                self.__split_lines()
+        return parse_reply(reply)
+
+    def _resync(self, timeout: float) -> None:
+        """
+        after a timed out call, interrupt the board (Ctrl-C) and drain output until a prompt with nothing following
+        it, so the next call never reads the previous command's late result
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._buf.clear()
+        self.serial.write(CTRL_C)
+        with self._cond:
+            size = -1
+            while not (self._buf.endswith(INPUT_SIGN) and len(self._buf) == size):
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f'REPL not back to an idle prompt within {timeout}s')
+                size = len(self._buf)
+                self._cond.wait(RESYNC_QUIET)
+            self._buf.clear()
+        self._dirty = False
 
     def close(self) -> None:
         self.serial.close()
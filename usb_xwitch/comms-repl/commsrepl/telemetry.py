@@ -0,0 +1,127 @@
+import serial
+import numpy as np
+import time
+
+# record layout, same as pico conf.TM
+MAGIC = 0xA5
+REC_LEN = 12
+TICKS_PERIOD = 1 << 30
+END = 0x00
+HEADER = 0x01
+VBUS = 0x02
+SWITCH = 0x03
+PORTS = 0x04
+RECORD = np.dtype([('magic', 'u1'), ('kind', 'u1'), ('chan', 'u1'), ('checksum', 'u1'), ('ts_us', '<u4'),
+                   ('value', '<u4')])
+CTRL_C = b'\x03'
+READ_SIZE = 4096
+
+
+def _checksum_ok(recs: np.ndarray) -> np.ndarray:
+    """
+    vectorized record check, magic byte and checksum
+    """
+    raw = recs.view(np.uint8).reshape(-1, REC_LEN).astype(np.uint32)
+    checksum = (raw.sum(axis=1) - raw[:, 3]) & 0xFF
+    return (recs['magic'] == MAGIC) & (checksum == recs['checksum'])
+
+
+def decode(buf: bytes) -> tuple:
+    """
+    decode telemetry records in bulk. Bytes not forming a valid record (REPL echo, line noise) are skipped by resyncing
+    on magic byte.
+    :return: (records structured array of RECORD, unconsumed tail bytes to prepend to next read)
+    """
+    data = np.frombuffer(buf, dtype=np.uint8)
+    chunks = []
+    pos = 0
+    while len(data) - pos >= REC_LEN:
+        starts = np.flatnonzero(data[pos:len(data) - REC_LEN + 1] == MAGIC)
+        if not len(starts):
+            pos = len(data) - REC_LEN + 1
+            break
+        pos += int(starts[0])
+        n = (len(data) - pos) // REC_LEN
+        recs = data[pos:pos + n * REC_LEN].view(RECORD)
+        ok = _checksum_ok(recs)
+        bad = np.flatnonzero(~ok)
+        good = int(bad[0]) if len(bad) else n
+        if good:
+            chunks.append(recs[:good])
+            pos += good * REC_LEN
+        else:
+            pos += 1  # false magic, resync from next byte
+    tail = bytes(buf[pos:])
+    records = np.concatenate(chunks) if chunks else np.empty(0, dtype=RECORD)
+    return records, tail
+
+
+def unwrap_ts(ts_us: np.ndarray) -> np.ndarray:
+    """
+    board ticks_us wraps at TICKS_PERIOD, unwrap into monotonic int64 microseconds from first record
+    """
+    if not len(ts_us):
+        return ts_us.astype(np.int64)
+    step = np.diff(ts_us.astype(np.int64)) % TICKS_PERIOD
+    return np.concatenate(([0], np.cumsum(step)))
+
+
+def split(records: np.ndarray) -> dict:
+    """
+    split decoded records into per kind arrays:
+        {'vbus': {1: (t_us, volts), 2: (t_us, volts)}, 'switch': (t_us, channel), 'ports': (t_us, hub_id, mask),
+         'sent': records board reported sent, None when END not received}
+    """
+    t_us = unwrap_ts(records['ts_us'])
+    kind = records['kind']
+    header = records[kind == HEADER]
+    scale = header['value'][0] * 1e-9 if len(header) else 0.0
+    vbus = kind == VBUS
+    res = {'vbus': {}, 'scale_v': scale}
+    for ch in (1, 2):
+        m = vbus & (records['chan'] == ch)
+        res['vbus'][ch] = (t_us[m], records['value'][m] * scale)
+    m = kind == SWITCH
+    res['switch'] = (t_us[m], records['value'][m])
+    m = kind == PORTS
+    res['ports'] = (t_us[m], records['chan'][m], records['value'][m])
+    end = records[kind == END]
+    res['sent'] = int(end['value'][-1]) if len(end) else None
+    return res
+
+
+class TelemetryReader(object):
+    """
+    start pico telemetry() stream and collect its records. Opens serial port on its own, do not share it with a running
+    SerialREPL
+    """
+    def __init__(self, port_name: str, baud=115200):
+        self.serial = serial.Serial(port_name, baudrate=baud, timeout=0.1)
+
+    def read(self, seconds: float, hz=1000) -> dict:
+        """
+        stream for seconds at hz VBus sampling rate, return split() arrays plus 'records' and 'dropped' counts
+        """
+        self.serial.write(CTRL_C)
+        self.serial.reset_input_buffer()
+        self.serial.write(f'telemetry({seconds}, {hz})\r\n'.encode())
+        chunks = []
+        tail = b''
+        ts = time.time()
+        done = False
+        while not done and time.time() - ts < seconds + 3:
+            records, tail = decode(tail + self.serial.read(max(READ_SIZE, self.serial.in_waiting)))
+            if len(records):
+                chunks.append(records)
+                done = bool((records['kind'] == END).any())
+        records = np.concatenate(chunks) if chunks else np.empty(0, dtype=RECORD)
+        res = split(records)
+        res['records'] = len(records)
+        res['dropped'] = res['sent'] + 1 - len(records) if res['sent'] is not None else None
+        return res
+
+    def close(self) -> None:
+        self.serial.close()
+
+    def __del__(self):
+        self.close()
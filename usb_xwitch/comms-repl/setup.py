@@ -5,5 +5,7 @@ setup(
     version='0.0.1',
     description='pico REPL communication protocol for python over serial.',
     long_description=open('README.md').read(),
-    install_requires=['pyserial']
+    install_requires=['pyserial'],
+    extras_require={'telemetry': ['numpy']},
+    entry_points={'console_scripts': ['xwitch=commsrepl.cli:main']}
 )
@@ -0,0 +1,189 @@
+"""
+On-board micro benchmarks. Copy to the board alongside main.py / conf.py and run from REPL:
+    >>> import bench
+    >>> bench.crc()
+"""
+import gc
+import time
+from conf import DC, DCView, HUBAddr, HW
+
+
+def _crc_str(data, poly_str='1101') -> int:
+    """
+    legacy bit string CRC (pre table driven version), kept as benchmark reference
+    """
+    bit_str = ''.join('{:08b}'.format(b) for b in data[:DC.MSG_LEN - 1])
+    poly_str = poly_str.lstrip('0')
+    input_pad_arr = list(bit_str + (len(poly_str) - 1) * '0')
+    while '1' in input_pad_arr[:len(bit_str)]:
+        cur_shift = input_pad_arr.index('1')
+        for i in range(len(poly_str)):
+            input_pad_arr[cur_shift + i] = str(int(poly_str[i] != input_pad_arr[cur_shift + i]))
+    return int(''.join(input_pad_arr)[len(bit_str):], 2)
+
+
+def _time_us(func, frames: list) -> int:
+    start_us = time.ticks_us()
+    for frame in frames:
+        func(frame)
+    return time.ticks_diff(time.ticks_us(), start_us)
+
+
+def crc(rounds=200) -> dict:
+    """
+    compare table driven CRC against legacy bit string CRC. returns average microseconds per frame
+    """
+    frames = [DC.make_data(DC.SET_HUB, i & 0xFF, (i * 7) & 0x0F, (i * 13) & 0xFF) for i in range(rounds)]
+    for frame in frames:
+        if _crc_str(frame) != DC.crc(frame):
+            raise ValueError(f'CRC mismatch on frame: {frame}')
+    res = {'table_us': _time_us(DC.crc, frames) / rounds, 'string_us': _time_us(_crc_str, frames) / rounds}
+    print(f"CRC-3 per frame: table {res['table_us']:.1f}us, string {res['string_us']:.1f}us, "
+          f"x{res['string_us'] / res['table_us']:.1f}")
+    return res
+
+
+def _main():
+    import __main__
+    return __main__
+
+
+def rx(seconds=5, m=None) -> dict:
+    """
+    sample daisy chain receive engine over a period. Reports loop wake ups per second (idle load, the former busy
+    polling loop spun tens of thousands of times per second) and uart data ready to relayed latency
+    """
+    uart = (m or _main())._uart
+    before = uart.rx_stats()
+    time.sleep(seconds)
+    after = uart.rx_stats()
+    res = {'wakeups_per_s': (after['wakeups'] - before['wakeups']) / seconds,
+           'reads': after['reads'] - before['reads'], 'lat_avg_us': after['lat_avg_us'],
+           'lat_max_us': after['lat_max_us']}
+    print(f"rx: {res['wakeups_per_s']:.0f} wakeups/s, {res['reads']} reads, "
+          f"latency avg {res['lat_avg_us']}us max {res['lat_max_us']}us")
+    return res
+
+
+def hub_init(rounds=5, m=None) -> dict:
+    """
+    time legacy per register hub init sequence against precompiled burst image (written and read back verified).
+    Both run right after a hub reset, hub port state is restored afterwards
+    """
+    m = m or _main()
+    hub = m._hub
+    ports = m.get_hub()
+
+    def _reset_raw():
+        m._hub_rst.value(HW.HIGH)
+        time.sleep_ms(HW.HUB_RST_HOLD_MS)
+        m._hub_rst.value(HW.LOW)
+        time.sleep_ms(HW.HUB_RST_SETTLE_MS)
+
+    legacy_us = image_us = 0
+    for _ in range(rounds):
+        _reset_raw()
+        start_us = time.ticks_us()
+        for reg in HUBAddr.INIT_DEFAULT + [HUBAddr.MAX_POWER_BUS] + HUBAddr.MFG_AUX_DEFAULT:
+            hub._bw(reg.addr, [reg.default_val])
+        for reg in HUBAddr.MFG_DEFAULT:
+            hub._bw(reg.addr[0], reg.default_val)
+        legacy_us += time.ticks_diff(time.ticks_us(), start_us)
+        _reset_raw()
+        start_us = time.ticks_us()
+        hub.shadow = bytearray(HUBAddr.POR_IMAGE)
+        hub._init_hub()
+        image_us += time.ticks_diff(time.ticks_us(), start_us)
+    hub.reset()
+    m.set_hub(list(ports))
+    res = {'legacy_us': legacy_us / rounds, 'image_us': image_us / rounds, 'bursts': len(HUBAddr.CFG_BURSTS)}
+    print(f"hub init: legacy {res['legacy_us']:.0f}us, image {res['image_us']:.0f}us "
+          f"({res['bursts']} block writes + read back verify)")
+    return res
+
+
+def chain_rtt(rounds=10, bauds=HW.UART_BAUDS, m=None) -> dict:
+    """
+    median GET_HUB round trip time against chain depth at each baud rate. Chain returned to default rate afterwards
+    """
+    m = m or _main()
+    res = {}
+    for baud in bauds:
+        if m.set_baud(baud) != baud:
+            print(f'{baud}: negotiation failed')
+            continue
+        res[baud] = {}
+        for hub_id in range(1, m.total_hubs):
+            rtt = []
+            for _ in range(rounds):
+                start_us = time.ticks_us()
+                m.get_hub_chain(hub_id)
+                rtt.append(time.ticks_diff(time.ticks_us(), start_us))
+            res[baud][hub_id] = sorted(rtt)[rounds // 2]
+        print(f"{baud}: " + ', '.join(f'depth {d}: {us}us' for d, us in res[baud].items()))
+    m.set_baud(HW.UART_BAUD)
+    return res
+
+
+def switch(rounds=10, m=None) -> dict:
+    """
+    switch back and forth, VBus settle time per direction. Worst case is the switchover time to quote, None when VBus
+    never settled within HW.SW_SETTLE_TIMEOUT_MS
+    """
+    m = m or _main()
+    start_ch = m.get_switch()
+    res = {}
+    for ch_no in (1 - start_ch, start_ch) * rounds:
+        res.setdefault(ch_no, []).append(m.switch_latency(ch_no)['settle_us'])
+    for ch_no, settle in res.items():
+        done = sorted(us for us in settle if us is not None)
+        res[ch_no] = {'max_us': done[-1] if done else None, 'median_us': done[len(done) // 2] if done else None,
+                      'timeouts': len(settle) - len(done)}
+        print(f"to ch{ch_no + 1}: settle max {res[ch_no]['max_us']}us, median {res[ch_no]['median_us']}us, "
+              f"{res[ch_no]['timeouts']} timeouts")
+    return res
+
+
+class _LoopUART(object):
+    """
+    uart stand-in handing out the same frame on every read, no allocation
+    """
+    def __init__(self, frame: bytes) -> None:
+        self.frame = frame
+
+    def readinto(self, buf, nbytes=None) -> int:
+        for i in range(len(self.frame)):
+            buf[i] = self.frame[i]
+        return len(self.frame)
+
+
+def alloc(rounds=200, m=None) -> dict:
+    """
+    heap bytes allocated per frame by frame decode, frame encode, framer feed (uart read into buffer and frame pulled
+    out) and relay fast path (fed frame addressed past any chain, relayed downstream), garbage collector disabled
+    while measuring. All expected 0
+    """
+    m = m or _main()
+    uart = m._uart
+    frame = DC.make_data(DC.GET_HUB, 0xFE, DC.DATA_DEF)
+    view = DCView()
+    buf = bytearray(DC.MSG_LEN)
+    framer = m.DCFramer(_LoopUART(frame))
+
+    def feed():
+        framer.feed()
+        return framer.next()
+
+    cases = (('decode', lambda: view.load(frame)), ('encode', lambda: DC.make_into(buf, DC.GET_HUB_RTN, 1, 2, 3)),
+             ('feed', feed), ('relay', lambda: uart.msg_switch(feed())))
+    res = {}
+    for name, func in cases:
+        gc.collect()
+        gc.disable()
+        free = gc.mem_free()
+        for _ in range(rounds):
+            func()
+        res[name] = (free - gc.mem_free()) / rounds
+        gc.enable()
+    print(', '.join(f'{name}: {b:.1f} bytes/frame' for name, b in res.items()))
+    return res
@@ -4,6 +4,51 @@ RegAddr = namedtuple("RegisterAddr", ("name", "addr", "default_val"))
 DCMSG = namedtuple("DaisychainMsg", ("raw", "cmd", "hub_no", "hub_stat", "rsvd"))
 
 
+def _crc_table(poly: int, width: int) -> bytes:
+    """
+    byte-wise CRC lookup table. entry i is the remainder of i * x^width divided by poly
+    """
+    table = bytearray(256)
+    for i in range(256):
+        reg = i << width
+        for bit in range(width + 7, width - 1, -1):
+            if reg & (1 << bit):
+                reg ^= poly << (bit - width)
+        table[i] = reg
+    return bytes(table)
+
+
+def _reg_image(regs: list, str_regs: list, por: dict) -> bytes:
+    """
+    full 256 byte register map: power-on values overlaid with configured registers and strings
+    """
+    image = bytearray(256)
+    for addr, val in por.items():
+        image[addr] = val
+    for reg in regs:
+        image[reg.addr] = reg.default_val
+    for reg in str_regs:
+        image[reg.addr[0]:reg.addr[0] + len(reg.default_val)] = bytes(reg.default_val)
+    return bytes(image)
+
+
+def _reg_bursts(image: bytes, addrs: list, max_block: int, base=None, gap=2) -> tuple:
+    """
+    SMBus block write payloads ([reg, count, data...]) covering sorted addrs (only those differing from base image if
+    given) with fewest transactions. Runs up to gap bytes apart merge, as a new transaction costs more bytes than
+    rewriting the registers in between
+    """
+    runs = []
+    for addr in addrs:
+        if base is not None and image[addr] == base[addr]:
+            continue
+        if runs and addr - runs[-1][1] <= gap + 1 and addr - runs[-1][0] < max_block:
+            runs[-1][1] = addr
+        else:
+            runs.append([addr, addr])
+    return tuple(bytes([start, end - start + 1]) + image[start:end + 1] for start, end in runs)
+
+
 class HUBAddr(object):
     """
     USB2514 Address constants
@@ -55,13 +100,27 @@ class HUBAddr(object):
     PORT_MAP_34 = RegAddr("PORT_MAP_34", 0xFC, 0x00)
     STAT_CMD = RegAddr("STAT_CMD", 0XFF, 0x00)  # Status / Command (SMBus only)
 
+    # USB2514B non-zero register values after RESET_N (datasheet SMBus register map), all others reset to 0x00
+    POR_DEFAULT = {0x00: 0x24, 0x01: 0x04, 0x02: 0x14, 0x03: 0x25, 0x04: 0xB3, 0x05: 0x0B, 0x06: 0x9B, 0x07: 0x20,
+                   0x08: 0x02, 0x0C: 0x01, 0x0D: 0x32, 0x0E: 0x01, 0x0F: 0x32, 0x10: 0x32, 0xFB: 0x21, 0xFC: 0x43}
+
     # Default Load List
     INIT_DEFAULT = [VENDOR_ID_LSB, VENDOR_ID_MSB, PRODUCT_ID_LSB, PRODUCT_ID_MSB, DEVICE_ID_LSB,
                     DEVICE_ID_MSB, CONFIG_DATA_B1, CONFIG_DATA_B2, CONFIG_DATA_B3, MAX_POWER_BUS,
-                    MAX_POWER_BUS, MAX_POWER_SELF, MAX_CURR_SELF, BATT_CHG_EN]
+                    MAX_POWER_SELF, MAX_CURR_SELF, BATT_CHG_EN]
     MFG_AUX_DEFAULT = [MFG_STR_LEN, PDT_STR_LEN, SN_STR_LEN, LANG_ID_HIGH, LANG_ID_LOW]
     MFG_DEFAULT = [MFG_STR, PDT_STR, SN_STR]
 
+    # Configuration image compiled once at import
+    MAX_BLOCK = 32  # max SMBus block read / write size for USB2514B
+    POR_IMAGE = _reg_image([], [], POR_DEFAULT)
+    CFG_IMAGE = _reg_image(INIT_DEFAULT + MFG_AUX_DEFAULT, MFG_DEFAULT, POR_DEFAULT)
+    CFG_ADDRS = sorted(set([reg.addr for reg in INIT_DEFAULT + MFG_AUX_DEFAULT] +
+                           [reg.addr[i] for reg in MFG_DEFAULT for i in range(len(reg.default_val))]))
+    CFG_SPAN = CFG_ADDRS[-1] + 1  # registers 0 to span are read back to verify
+    CFG_BURSTS = _reg_bursts(CFG_IMAGE, CFG_ADDRS, MAX_BLOCK, POR_IMAGE)
+    CFG_FULL_BURSTS = _reg_bursts(CFG_IMAGE, CFG_ADDRS, MAX_BLOCK)  # when hub register state unknown
+
 
 class HW(object):
     HIGH = 1
@@ -75,25 +134,47 @@ class HW(object):
     SEL_U3 = 11  # SEL (selection) USB3 Mux pin
     SW_REL = 19  # Switch channel power switching pin
     SW_MAN = 7  # Manual channel switch pin
+    SW_SEL_MASK = (1 << SEL_U2) | (1 << SEL_U3) | (1 << SW_REL)  # switch select lines, moved in one SIO write
+    SW_DEBOUNCE_MS = 200  # manual switch button presses within this window ignored
+    # RP2040 SIO GPIO registers
+    SIO_GPIO_IN = 0xd0000004
+    SIO_GPIO_OUT_SET = 0xd0000014
+    SIO_GPIO_OUT_CLR = 0xd0000018
     # HUB Pins
     HUB_RST = 18  # HUB IC RESETn control
     HUB_SCL = 17
     HUB_SDA = 16
+    HUB_RST_HOLD_MS = 1  # RESET_N assert time. USB2514B needs microseconds
+    HUB_RST_SETTLE_MS = 10  # wait after RESET_N release before SMBus config
     # Comms
     UART_U_TX = 0  # UART upstream tx
     UART_U_RX = 1  # UART upstream rx
     UART_D_TX = 4  # UART downstream tx
     UART_D_RX = 5  # UART downstream rx
     UART_BAUD = 9600  # UART default baud rate
+    UART_BAUDS = (9600, 19200, 38400, 57600, 115200, 230400, 460800)  # negotiable rates, DC.SET_BAUD index
     # ADC Pins
     ADC_1_1 = 26  # CHA mus 2-1 VBus voltage
     ADC_1_2 = 27  # CHA mus 2-2 VBus voltage
     # Conversion
     ADC_RATIO = 18/33  # ADC voltage divider ratio
     ADC_REF_V = 3.3  # ADC reference voltage
+    VBUS_MIN_V = 4.4  # lowest VBus voltage regarded as valid at the switch output
+    VBUS_SETTLE_SAMPLES = 8  # consecutive valid readings for VBus regarded as settled
+    VBUS_MAX_V = 5.5  # VBus readings above regarded as overvoltage
     # Software params
-    Q_LEN = 10
-    DATA_SIZE = 20  # data payload read size
+    Q_LEN = 32  # fits a full rack of pipelined acks while root hub resets
+    RX_POLL_MS = 50  # max receive loop sleep when both uarts are idle
+    TOPO_FILE = 'topology.json'  # daisy chain topology cache in flash
+    RX_BUF_LEN = 64  # daisy chain framer receive buffer size per uart
+    SW_LOG_LEN = 32  # switch events kept in log
+    SW_SETTLE_TIMEOUT_MS = 500  # switch_latency gives up waiting for VBus after this
+    VBUS_SAMPLE_HZ = 1000  # VBus monitor sampling rate per channel
+    VBUS_OVERSAMPLE = 4  # adc reads averaged into one VBus sample
+    VBUS_RING_LEN = 512  # VBus samples kept per channel for statistics
+    VBUS_EVT_LEN = 32  # VBus threshold crossing events kept
+    BOOT_DEFER_MS = 20  # hub config and VBus sampling start this long after main.py imported, REPL first
+    GC_LOW_WATER = 16 * 1024  # idle receive loop collects garbage below this many free heap bytes
 
 
 class DC(object):
@@ -108,11 +189,22 @@ class DC(object):
     +----------+-------------+-------------+-----------+------+-------+
     |   0xDC   |    byte     |   byte      |   byte    | byte | byte  |
     +----------+-------------+-------------+-----------+------+-------+
+
+    RSVD carries the request id of root issued requests (1 - 255), echoed back in replies. 0 when unsolicited.
     """
     DC_CH = 3  # default channel 4 as downstream daisy chain channel
     MSG_LEN = 6  # Daisy chain data message length 
+    CRC_POLY = 0b1101  # CRC-3 polynomial x^3 + x^2 + x^0
+    CRC_WIDTH = 3
+    CRC_TABLE = _crc_table(CRC_POLY, CRC_WIDTH)
     END_CHAIN_TIMEOUT = 1000  # daisy chain scan broadcast miliseconds for end of chain hub scan
     BROADCAST_TIMEOUT = 3000  # whole daisy chain hub broadcast process timeout in miliseconds
+    PING_HOP_TIMEOUT = 20  # per hop allowance in miliseconds of a topology validation PING sweep
+    RESTORE_RETRIES = 4  # restore_chain retries while downstream hubs still booting, cache kept meanwhile
+    RESTORE_BACKOFF_MS = 500  # first restore_chain retry delay, doubling each retry
+    BAUD_CONFIRM_TIMEOUT = 2000  # miliseconds for a committed baud rate to be confirmed before falling back
+    BAUD_RESET_MS = 10  # allowance for first hop to relay BAUD_RESET and switch rate before next frame
+    BAUD_BAD_BYTES = 6  # upstream bytes read without a valid frame making a hub off default rate fall back
     # header and EoM
     DC_HEADER = 0xDC  # start of message
 
@@ -129,9 +221,36 @@ class DC(object):
     SET_HUB_RTN = 0x12
     GET_HUB = 0x03
     GET_HUB_RTN = 0x13
-    SET_SWITCH = 0x04  # Hub No is switch to MUX channel
+    SET_SWITCH = 0x04  # Hub No: hub chain no, Hub Stat: switch to MUX channel 0 / 1
+    SET_SWITCH_RTN = 0x14
     GET_SWITCH = 0x05
+    GET_SWITCH_RTN = 0x15  # Hub Stat: MUX channel, ERROR when selection lines disagree
     GET_TOT_HUBS = 0x06  # get total hubs number
+    GET_TOT_HUBS_RTN = 0x16  # Hub Stat: total hubs seen by the addressed hub
+    GET_HUBS = 0x07  # chain status sweep. Relayed down to end of chain, every hub returns its own GET_HUBS_RTN
+    GET_HUBS_RTN = 0x17
+    PING = 0x08  # topology validation sweep. Hub No: root cached total hubs, Hub Stat: hop count
+    PING_RTN = 0x18
+    SET_BAUD = 0x09  # chain baud rate negotiation. Hub No: phase, Hub Stat: HW.UART_BAUDS index
+    SET_BAUD_RTN = 0x19
+    GET_STATS = 0x0A  # stats sweep. Hub No: requesting hub, Hub Stat: PerfStats.FIELDS index
+    GET_STATS_RTN = 0x1A  # Hub No: hub, Hub Stat: minifloat value (ERROR for unknown field)
+    BAUD_PROPOSE = 0x00
+    BAUD_COMMIT = 0x01
+    BAUD_CONFIRM = 0x02
+    BAUD_RESET = 0x03  # back to HW.UART_BAUD, sent at current rate and relayed by every hop before switching
+    """
+    MCAST: cmd flag. Hub No is a group bitmask, every hub in a group applies then relays. Single gathered RTN with
+        Hub No: hubs applied, Hub Stat: hubs failed
+    """
+    MCAST = 0x80
+    GROUP_ALL = 0xFF  # broadcast, every hub is member of all groups by default
+    SET_HUB_MCAST = SET_HUB | MCAST
+    SET_HUB_MCAST_RTN = SET_HUB_RTN | MCAST
+    SET_SWITCH_MCAST = SET_SWITCH | MCAST  # Hub Stat is switch to MUX channel
+    SET_SWITCH_MCAST_RTN = SET_SWITCH_RTN | MCAST
+    MCAST_RTN = {SET_HUB_MCAST: SET_HUB_MCAST_RTN, SET_SWITCH_MCAST: SET_SWITCH_MCAST_RTN}
+    MCAST_RTNS = (SET_HUB_MCAST_RTN, SET_SWITCH_MCAST_RTN)
 
     # Hub stat field
     ACK = 0x01  # used for downstream ack upscream uart dc relaying message
@@ -147,12 +266,57 @@ class DC(object):
     # default values
     DATA_DEF = 0x0  # Default data field value 0
     # RSVD
-    RSVD = 0x0  # Reserved field
+    RSVD = 0x0  # Reserved field, no request id
+
+    @staticmethod
+    def crc(data, offset=0) -> int:
+        """
+        table driven CRC-3 over message header and payload (all bytes except the last CRC byte) starting at offset
+        """
+        crc = 0
+        table = DC.CRC_TABLE
+        for i in range(offset, offset + DC.MSG_LEN - 1):
+            crc = table[(crc << (8 - DC.CRC_WIDTH)) ^ data[i]]
+        return crc
+
+    @staticmethod
+    def check_crc(data, offset=0) -> bool:
+        return DC.crc(data, offset) == data[offset + DC.MSG_LEN - 1]
+
+    @staticmethod
+    def minifloat(val: int) -> int:
+        """
+        encode a non negative int into one byte, 5 bit exponent and 3 bit mantissa (within 12.5%, up to 15 << 30)
+        """
+        if val < 8:
+            return val
+        exp = 1
+        while val >= 16:
+            val >>= 1
+            exp += 1
+        return (min(exp, 31) << 3) | (val & 0x07)
+
+    @staticmethod
+    def from_minifloat(code: int) -> int:
+        exp = code >> 3
+        return code if exp == 0 else (0x08 | (code & 0x07)) << (exp - 1)
 
     @staticmethod
     def make_data(cmd: int, data1: int, data2: int, rsvd=RSVD) -> bytes:
-        # TODO: CRC calculation for last byte
-        return bytes([DC.DC_HEADER, cmd, data1, data2, rsvd, 0x0])
+        return bytes(DC.make_into(bytearray(DC.MSG_LEN), cmd, data1, data2, rsvd))
+
+    @staticmethod
+    def make_into(buf, cmd: int, data1: int, data2: int, rsvd=RSVD):
+        """
+        encode a frame into a preallocated MSG_LEN buffer, no allocation. return buf
+        """
+        buf[0] = DC.DC_HEADER
+        buf[1] = cmd
+        buf[2] = data1
+        buf[3] = data2
+        buf[4] = rsvd
+        buf[5] = DC.crc(buf)
+        return buf
 
     @classmethod
     def decode_data(cls, data: bytes) -> DCMSG:
@@ -160,8 +324,55 @@ class DC(object):
             raise ValueError("Invalid data length to decode.")
         if data[0] != cls.DC_HEADER:
             raise ValueError("Invalid daisy chain message header")
+        if not cls.check_crc(data):
+            raise ValueError("Invalid daisy chain message CRC")
         return DCMSG(data, data[1], data[2], data[3], data[4])
 
 
+class DCView(object):
+    """
+    reusable decoded daisy chain frame with DCMSG fields. load() decodes in place so receiving allocates nothing,
+    copy() takes a DCMSG to keep past the next load
+    """
+    def __init__(self) -> None:
+        self.raw = bytearray(DC.MSG_LEN)
+        self.cmd = self.hub_no = self.hub_stat = self.rsvd = 0
+
+    def load(self, data, offset=0) -> 'DCView':
+        raw = self.raw
+        for i in range(DC.MSG_LEN):
+            raw[i] = data[offset + i]
+        self.cmd = raw[1]
+        self.hub_no = raw[2]
+        self.hub_stat = raw[3]
+        self.rsvd = raw[4]
+        return self
+
+    def copy(self) -> DCMSG:
+        return DCMSG(bytes(self.raw), self.cmd, self.hub_no, self.hub_stat, self.rsvd)
+
+    def __repr__(self) -> str:
+        return repr(self.copy())
+
+
+class TM(object):
+    """
+    Binary telemetry record, little endian 12 bytes:
+        MAGIC | KIND | CHAN | CHECKSUM | TS_US (u32) | VALUE (u32)
+    CHECKSUM is sum of all other bytes & 0xFF. TS_US is time.ticks_us, wraps at TICKS_PERIOD
+    """
+    FMT = '<BBBBII'
+    LEN = 12
+    MAGIC = 0xA5
+    TICKS_PERIOD = 1 << 30
+    BATCH = 32  # records per serial write
+    # kind field
+    END = 0x00  # stream finished, value: records sent before
+    HEADER = 0x01  # stream start, value: VBUS scale in nV per adc count
+    VBUS = 0x02  # chan: adc channel 1 / 2, value: adc u16 reading (oversampled)
+    SWITCH = 0x03  # value: switch channel
+    PORTS = 0x04  # chan: hub chain id, value: hub channels on bitmask
+
+
 class TimeOutError(BaseException):
     pass
@@ -1,8 +1,16 @@
-from machine import Pin, ADC, UART, I2C
-from conf import HUBAddr, HW, DC, DCMSG
+from machine import Pin, ADC, UART, I2C, Timer, mem32, disable_irq, enable_irq
+from conf import HUBAddr, HW, DC, DCMSG, DCView, TM
 import time
 from collections import deque
 import _thread
+import select
+import micropython
+import gc
+import json
+import struct
+import sys
+from array import array
+_boot_log = [('main', time.ticks_us())]  # boot timeline (stage, ticks_us), first stage main.py started
 
 __pcb__ = '0.2'
 __version__ = '0.2 a1'
@@ -12,16 +20,98 @@ led_ind_stat = False
 hub_chain_id = -1
 total_hubs = -1
 eoc = False  # end of daisy chain flag
+_topo_saved = None  # signature of topology last saved to flash
+hub_groups = DC.GROUP_ALL  # multicast group membership bitmask of this hub
+_sw_log = deque((), HW.SW_LOG_LEN)  # switch events: (ticks_ms, source, channel)
+_btn_ms = 0  # last accepted manual switch button press
+_tm_q = None  # telemetry events (kind, chan, ticks_us, value) while streaming
+_hw_state = 0  # deferred hardware init: 0 pending, 1 running, 2 done
+_restore_due = -1  # retries left of a restore_chain run flagged for rx_thread (_restore_poll), -1 none
+_restore_at = 0  # ticks_ms next step of that run is due: start, sweep window end
+_restore_rid = 0  # PING sweep request id of that run while its window runs
+_restore_boot = False  # that run is the boot one, logged as boot stage chain once finished
+
+
+def _boot(stage: str) -> None:
+    _boot_log.append((stage, time.ticks_us()))
+
+
+def boot_log() -> list:
+    """
+    boot timeline as (stage, us since power on, us since previous stage). Stages: main (main.py started), pins,
+    topology, uart (relaying up, main.py done next), then deferred hub, vbus and ready, and chain (topology
+    validated, on the root after ready as rx_thread runs it). A stage failed to come up logged with ' error' appended
+    """
+    res = []
+    prev = 0
+    for stage, ticks in _boot_log:
+        res.append((stage, ticks, ticks - prev))
+        prev = ticks
+    return res
+
+
+def _boot_hw(_=None) -> None:
+    """
+    boot stage 2: hub register config and attach, VBus sampling, root hub topology validation. One shot timer
+    HW.BOOT_DEFER_MS after main.py is imported so REPL and relaying are up first, or run by first use of hub or VBus
+    monitor. Topology validation only flagged here, rx_thread runs it
+    """
+    global _hw_state, _restore_boot
+    if _hw_state:
+        return
+    _hw_state = 1
+    try:
+        for stage, func in (('hub', _hub.start), ('vbus', _vbus.start)):
+            try:
+                func()
+                _boot(stage)
+            except OSError as e:
+                if _debug: print(f"boot: {stage} failed: {e}")
+                _boot(stage + ' error')
+        if hub_chain_id == 0:  # topology cached in flash, root validates it instead of a full scan
+            _restore_boot = True
+            _restore_later(DC.RESTORE_RETRIES)
+        else:
+            _boot('chain')
+        _boot('ready')
+    finally:
+        _hw_state = 2
+
+
+def _hw_ready() -> None:
+    """
+    make sure deferred hardware init done before hub or VBus monitor used
+    """
+    if _hw_state == 2:
+        return
+    if _hw_state == 1:  # first use from a callback interrupting stage 2
+        raise OSError('hardware init in progress')
+    _boot_hw()
 
 
 def _intr_change_switch(pin) -> None:
-    cur = get_switch()
-    if cur == 1:
-        set_switch(0)
-    elif cur == 0:
-        set_switch(1)
-    else:
-        raise ValueError(f'manual channel {cur} invalid position')
+    """
+    manual switch button IRQ. Debounced here, the switching itself deferred to main context
+    """
+    global _btn_ms
+    now = time.ticks_ms()
+    if time.ticks_diff(now, _btn_ms) < HW.SW_DEBOUNCE_MS:
+        return
+    _btn_ms = now
+    try:
+        micropython.schedule(_btn_change_switch, None)
+    except RuntimeError:  # schedule queue full, press dropped
+        pass
+
+
+def _btn_change_switch(_) -> None:
+    if _sw_man.value() != HW.LOW:  # released before scheduled, a glitch
+        return
+    try:
+        set_switch(1 - get_switch(), 'button')
+    except ValueError as e:
+        _sw_log.append((time.ticks_ms(), 'button', -1))
+        if _debug: print(f'manual switch failed: {e}')
 
 
 def ind_led(en: bool) -> None:
@@ -44,31 +134,153 @@ def get_adc(no: int) -> float:
     """
     get adc reading from adc channel
     """
-    adc = {1: _adc_a1, 2: _adc_a2}
-    if adc.get(no) is None:
+    if no not in (1, 2):
         raise ValueError(f'adc {no} invalid')
-    return adc.get(no).read_u16() * HW.ADC_REF_V / 65536 / HW.ADC_RATIO
+    return _adc_v(_adcs[no - 1].read_u16())
+
+
+def _adc_v(raw: int) -> float:
+    """
+    convert adc u16 reading to VBus voltage
+    """
+    return raw * HW.ADC_REF_V / 65536 / HW.ADC_RATIO
+
+
+def _v_adc(volts: float) -> int:
+    """
+    convert VBus voltage to adc u16 reading
+    """
+    return int(volts * HW.ADC_RATIO * 65536 / HW.ADC_REF_V)
+
+
+def telemetry(seconds=0, hz=HW.VBUS_SAMPLE_HZ) -> int:
+    """
+    stream binary telemetry records (conf.TM) on usb serial instead of REPL text: a HEADER, VBus of both channels at
+    hz (HW.VBUS_OVERSAMPLE averaged), switch and port changes as they happen, then an END. Runs for seconds, 0 until
+    Ctrl-C. Host side decoder: commsrepl.telemetry
+    return records sent
+    """
+    global _tm_q
+    out = sys.stdout.buffer
+    buf = bytearray(TM.LEN * TM.BATCH)
+    mv = memoryview(buf)
+    flush_at = len(buf) - TM.LEN * len(_adcs)
+    period_us = 1000000 // hz
+    sent = pos = 0
+    _tm_q = deque((), HW.Q_LEN)
+    start_us = next_us = time.ticks_us()
+    pos = _tm_pack(buf, pos, TM.HEADER, 0, start_us, int(_adc_v(1) * 1e9))
+    try:
+        while not seconds or time.ticks_diff(time.ticks_us(), start_us) < seconds * 1000000:
+            while time.ticks_diff(next_us, time.ticks_us()) > 0:
+                pass
+            next_us = time.ticks_add(next_us, period_us)
+            ts_us = time.ticks_us()
+            for ch in range(len(_adcs)):
+                acc = 0
+                for _ in range(HW.VBUS_OVERSAMPLE):
+                    acc += _adcs[ch].read_u16()
+                pos = _tm_pack(buf, pos, TM.VBUS, ch + 1, ts_us, acc // HW.VBUS_OVERSAMPLE)
+            while len(_tm_q) > 0 and pos <= flush_at:
+                pos = _tm_pack(buf, pos, *_tm_q.popleft())
+            if pos > flush_at:
+                out.write(mv[:pos])
+                sent += pos // TM.LEN
+                pos = 0
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _tm_q = None
+    if pos > flush_at:  # Ctrl-C between pack and flush may have left no room for END
+        out.write(mv[:pos])
+        sent += pos // TM.LEN
+        pos = 0
+    sent += pos // TM.LEN
+    pos = _tm_pack(buf, pos, TM.END, 0, time.ticks_us(), sent)
+    out.write(mv[:pos])
+    return sent + 1
 
 
-def set_switch(ch_no: int) -> None:
+def _tm_pack(buf, pos: int, kind: int, chan: int, ts_us: int, value: int) -> int:
     """
-    set usb switch position. switch to 0 or 1 (ch1 or ch2)
+    pack a telemetry record into buf at pos, return position after it
+    """
+    struct.pack_into(TM.FMT, buf, pos, TM.MAGIC, kind, chan, 0, ts_us, value)
+    checksum = 0
+    for i in range(pos, pos + TM.LEN):
+        checksum += buf[i]
+    buf[pos + 3] = checksum & 0xFF
+    return pos + TM.LEN
+
+
+def vbus_stats(reset=False) -> dict:
+    """
+    VBus monitor statistics of both channels over last HW.VBUS_RING_LEN samples, plus threshold crossing events.
+    e.g. {1: {'min': 4.98, 'max': 5.07, 'mean': 5.02, 'rms': 5.02, 'n': 512, 'low': 0, 'high': 0}, 2: {...},
+          'events': [(ticks_ms, channel, 'low' / 'ok' / 'high', volts), ...], 'overruns': 0}
+    reset=True clears samples and events after reading
+    """
+    _hw_ready()
+    return _vbus.stats(reset)
+
+
+def set_switch(ch_no: int, src='cmd') -> None:
+    """
+    set usb switch position. switch to 0 or 1 (ch1 or ch2). Both mux selections and relay move together in one SIO
+    register write, no mixed state in between. Logged with its source
     """
     if ch_no not in [0, 1]:
         raise ValueError(f'cannot switch cha to {ch_no} (ch{ch_no+1}). Only 0, 1 (2 channels) supported')
-    _sw2_sel.value(ch_no)
-    _sw3_sel.value(ch_no)
-    _sw_rel.value(ch_no)
+    mem32[HW.SIO_GPIO_OUT_SET if ch_no else HW.SIO_GPIO_OUT_CLR] = HW.SW_SEL_MASK
+    _sw_log.append((time.ticks_ms(), src, ch_no))
+    if _tm_q is not None:
+        _tm_q.append((TM.SWITCH, 0, time.ticks_us(), ch_no))
 
 
 def get_switch() -> int:
     """
-    get current usb switch position. Expect 1 or 2.
+    get current usb switch position. Expect 0 or 1.
     """
-    switch_ctrl = [_sw2_sel.value(), _sw3_sel.value(), _sw_rel.value()]
-    if len(set(switch_ctrl)) > 1:  # if not all 0 or all 1
-        raise ValueError(f'internal error. ICs selection or Relay selection error. sel_2, sel_3, rel: {switch_ctrl}')
-    return switch_ctrl[1]  # return any value from switch list
+    switch_ctrl = mem32[HW.SIO_GPIO_IN] & HW.SW_SEL_MASK  # all select lines sampled at once
+    if switch_ctrl not in (0, HW.SW_SEL_MASK):  # if not all 0 or all 1
+        raise ValueError(f'internal error. ICs selection or Relay selection error. sel_2, sel_3, rel: '
+                         f'{[_sw2_sel.value(), _sw3_sel.value(), _sw_rel.value()]}')
+    return int(switch_ctrl != 0)
+
+
+def switch_log() -> list:
+    """
+    switch events oldest first, as (ticks_ms, source, channel). source: cmd, button, chain or mcast, channel -1 when
+    a button press failed
+    """
+    return list(_sw_log)
+
+
+def switch_latency(ch_no: int, timeout_ms=HW.SW_SETTLE_TIMEOUT_MS) -> dict:
+    """
+    switch to a channel and measure until its VBus reading settles above HW.VBUS_MIN_V for HW.VBUS_SETTLE_SAMPLES
+    consecutive readings. return {'switch_us': select lines written, 'settle_us': VBus settled, None on timeout,
+    'vbus': last reading}
+    """
+    start_us = time.ticks_us()
+    set_switch(ch_no)
+    switch_us = time.ticks_diff(time.ticks_us(), start_us)
+    settle_us = None
+    valid = 0
+    vbus = 0.0
+    while time.ticks_diff(time.ticks_us(), start_us) < timeout_ms * 1000:
+        vbus = get_adc(ch_no + 1)
+        if vbus < HW.VBUS_MIN_V:
+            valid = 0
+            continue
+        valid += 1
+        if valid == 1:
+            settle_us = time.ticks_diff(time.ticks_us(), start_us)
+        if valid >= HW.VBUS_SETTLE_SAMPLES:
+            break
+    else:
+        settle_us = None
+    return {'switch_us': switch_us, 'settle_us': settle_us, 'vbus': vbus}
 
 
 def discovery_chain() -> int:
@@ -80,6 +292,170 @@ def discovery_chain() -> int:
     return _uart.dc_broadcast()
 
 
+def set_baud(baud: int) -> int:
+    """
+    using current hub as daisy chain root hub, negotiate daisy chain uart baud rate (one of HW.UART_BAUDS) with all
+    downstream hubs. Whole chain falls back to HW.UART_BAUD when any hop fails to confirm, and at next discovery.
+
+    return baud rate in use
+    """
+    if baud not in HW.UART_BAUDS:
+        raise ValueError(f'baud rate {baud} not supported: {HW.UART_BAUDS}')
+    if baud == _uart.baud:
+        return baud
+    if total_hubs <= 1:
+        _uart._set_uart_baud(baud)
+        return baud
+    idx = HW.UART_BAUDS.index(baud)
+    rid = _uart.request(DC.SET_BAUD, DC.BAUD_PROPOSE, idx)
+    replies = _uart.wait(rid, DC.BROADCAST_TIMEOUT)
+    if not replies or replies[0].hub_stat != DC.ACK:
+        if _debug: print(f"DaisyChain: baud rate {baud} rejected: {replies}")
+        return _uart.baud
+    frame_ms = DC.MSG_LEN * 10 * 1000 // _uart.baud + 1  # frame time at current rate
+    _uart.send_downstream(DC.make_data(DC.SET_BAUD, DC.BAUD_COMMIT, idx))
+    _uart._set_uart_baud(baud)
+    time.sleep_ms(2 * total_hubs * frame_ms)  # every hop relays COMMIT at old rate before switching
+    rid = _uart.request(DC.SET_BAUD, DC.BAUD_CONFIRM, idx)
+    replies = _uart.wait(rid, DC.BROADCAST_TIMEOUT)
+    if replies and replies[0].hub_stat == DC.ACK:
+        return baud
+    if _debug: print(f"DaisyChain: baud rate {baud} not confirmed, falling back to {HW.UART_BAUD}")
+    _uart._set_uart_baud(HW.UART_BAUD)
+    time.sleep_ms(DC.BAUD_CONFIRM_TIMEOUT)  # downstream hubs fall back on their own
+    return HW.UART_BAUD
+
+
+def restore_chain(retries=DC.RESTORE_RETRIES) -> int:
+    """
+    using current hub as daisy chain root hub, validate topology cached in flash with a single PING sweep. Full
+    discovery_chain only when cache missing, sweep fails or chain changed. The sweep always waits its whole window,
+    2 * (total hubs + 1) * DC.PING_HOP_TIMEOUT, valid chain or not, as a second reply is how a grown chain shows.
+    When the discovery finds no chain either (downstream boards still booting after a rack power cycle), the cache
+    is kept and the check retried in the background up to retries times, DC.RESTORE_BACKOFF_MS doubling each time.
+    Boot and retries run from rx_thread idle passes (_restore_poll), never a timer callback, so the sweep window and
+    a discovery leave REPL, VBus sampling and local commands running
+
+    return total hubs available on the chain (include current hub), -1 while not found
+    """
+    rid = _restore_ping()
+    if rid < 0:
+        return discovery_chain()
+    if rid == 0:
+        return total_hubs
+    return _restore_check(_uart.wait(rid, _ping_window_ms(), 2, window=True), retries)  # 2nd reply: chain grew
+
+
+def _ping_window_ms() -> int:
+    return 2 * (total_hubs + 1) * DC.PING_HOP_TIMEOUT
+
+
+def _restore_ping() -> int:
+    """
+    first step of restore_chain: load topology cached in flash and send the PING sweep
+    return sweep request id, 0 when cached chain is this hub alone, -1 when no cache of a root hub to validate
+    """
+    if not _load_topology() or hub_chain_id != 0:
+        return -1
+    if total_hubs == 1:
+        return 0
+    return _uart.request(DC.PING, total_hubs, 1)  # hop count starts at first downstream hub
+
+
+def _restore_check(replies: list, retries: int) -> int:
+    """
+    last step of restore_chain once the sweep window passed: cache kept when only end of chain replied, else a full
+    discovery, flagged to retry (_restore_later) when it finds no chain
+    """
+    if len(replies) == 1 and replies[0].hub_no + 1 == total_hubs and replies[0].hub_stat == total_hubs:
+        if _debug: print(f"DaisyChain: cached topology valid, total hubs: {total_hubs}")
+        return total_hubs
+    if _debug: print(f"DaisyChain: cached topology stale, ping replies: {replies}. Rescanning")
+    total = discovery_chain()
+    if total < 0 and retries > 0:
+        backoff_ms = DC.RESTORE_BACKOFF_MS << (DC.RESTORE_RETRIES - retries)
+        if _debug: print(f"DaisyChain: no chain found, cached topology kept, retrying in {backoff_ms}ms")
+        _restore_later(retries - 1, backoff_ms)
+    return total
+
+
+def _restore_later(retries: int, delay_ms=0) -> None:
+    """
+    flag a restore_chain run for rx_thread, starting delay_ms from now
+    """
+    global _restore_due, _restore_at
+    _restore_at = time.ticks_add(time.ticks_ms(), delay_ms)
+    _restore_due = retries  # set last, rx_thread polls it
+
+
+def _restore_poll() -> None:
+    """
+    one rx_thread idle pass step of a flagged restore_chain run: sweep sent, then judged once its window passed, never
+    waiting in between. A discovery it falls back to blocks rx_thread only, as one run from REPL holds q_lock
+    """
+    global _restore_due, _restore_rid, _restore_at, _restore_boot
+    if time.ticks_diff(time.ticks_ms(), _restore_at) < 0:
+        return
+    retries = _restore_due
+    _restore_due = -1
+    if _restore_rid:
+        rid = _restore_rid
+        _restore_rid = 0
+        total = _restore_check(_uart.wait(rid, 0, 2, window=True), retries)
+    else:
+        rid = _restore_ping()
+        if rid > 0:
+            _restore_rid = rid
+            _restore_at = time.ticks_add(time.ticks_ms(), _ping_window_ms())
+            _restore_due = retries
+            return
+        total = total_hubs if rid == 0 else discovery_chain()
+    if _restore_boot and _restore_due < 0:  # boot run finished, retries included
+        _restore_boot = False
+        _boot('chain' if total > 0 else 'chain error')
+
+
+def _topology_sig(hub_id: int, total: int) -> str:
+    """
+    chain signature, binding hub position and chain size to firmware version (daisy chain protocol)
+    """
+    return f'{__version__}:{hub_id}/{total}'
+
+
+def _save_topology() -> None:
+    """
+    persist chain position and size to flash, skipped when unchanged
+    """
+    global _topo_saved
+    sig = _topology_sig(hub_chain_id, total_hubs)
+    if sig == _topo_saved:
+        return
+    try:
+        with open(HW.TOPO_FILE, 'w') as f:
+            json.dump({'id': hub_chain_id, 'total': total_hubs, 'sig': sig}, f)
+        _topo_saved = sig
+    except OSError as e:
+        if _debug: print(f"DaisyChain: saving topology failed: {e}")
+
+
+def _load_topology() -> bool:
+    """
+    load chain position and size saved in flash. return False when missing, invalid or standalone
+    """
+    global hub_chain_id, total_hubs, _topo_saved
+    try:
+        with open(HW.TOPO_FILE) as f:
+            topo = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if topo.get('sig') != _topology_sig(topo.get('id'), topo.get('total')) or topo['id'] < 0:
+        return False
+    hub_chain_id = topo['id']
+    total_hubs = topo['total']
+    _topo_saved = topo['sig']
+    return True
+
+
 def set_hub(on_off_lst: list) -> None:
     """
     set usb hub channels using a list of bool values.
@@ -87,14 +463,34 @@ def set_hub(on_off_lst: list) -> None:
     """
     if len(on_off_lst) != 4:
         raise ValueError('on off list should be a length of 4 (channels)')
-    _hub.reset()
-    _hub._init_hub()
-    vals = [v for k, v in zip(on_off_lst, HUBAddr.PORTS_MASK) if not k]
-    _hub._bw(HUBAddr.PORT_DISABLE_SELF.addr, [sum(vals)])
-    _hub.attach()
+    mask = 0
+    for i in range(4):
+        if on_off_lst[i]:
+            mask |= DC.CHANNEL_MSKS[i]
+    set_hub_mask(mask)
 
 
-def set_hub_chain(*args) -> None:
+def set_hub_mask(mask: int) -> None:
+    """
+    set usb hub channels by on bitmask (DC.CHANNEL_MSKS, bit 0 channel 1). Chain commands apply port states this way
+    without building lists. e.g. set_hub_mask(0b0110) set hub channel 2 & 3 on and 1 & 4 off
+    """
+    _hw_ready()
+    _hub.set_ports((~mask & 0x0F) << 1)  # HUBAddr.PORT_MSK_n is DC.CHANNEL_MSK_n << 1, disable bits set for off
+    if _tm_q is not None:
+        _tm_q.append((TM.PORTS, max(hub_chain_id, 0), time.ticks_us(), mask))
+
+
+def _chain_stat(hub_id: int, on_off_lst: list) -> int:
+    """
+    encode chained hub channel on/off list into SET_HUB hub stat field
+    """
+    if len(on_off_lst) > len(DC.CHANNEL_MSKS) - 1 and hub_id + 1 < total_hubs:
+        raise IndexError(f"Too many channels to set hub: {hub_id}. (mid-chain hubs need one channel for next hub)")
+    return sum([ch for ch_on, ch in zip(on_off_lst, DC.CHANNEL_MSKS) if ch_on])
+
+
+def set_hub_chain(*args, pipelined=False):
     """
     set hub channel on off in chain giving its id. id as kwargs name and bool list as argument.
     syntax:
@@ -102,67 +498,263 @@ def set_hub_chain(*args) -> None:
         - args represents hub index in order
         - each args accpet a bool list that contains on off status of its channel. 3 values accpeted except for
             the last channek which has 4 values (no next hub using one channel for daisy chain)
+        - pipelined=True sends all SET_HUB at once so hubs reset in parallel, and returns list of hub ids failed to
+            ack within DC.BROADCAST_TIMEOUT instead of raising on first missing ack
     e.g.:
         >>> set_hub_chain(None, [1,0,0])  # set 2nd hub (hub id 1) channel 1 on, 2 & 3 off, first hub unchanged (None). 
         Where channel 4 used for connecting next chain hub.
         >>> set_hub_chain(None, None, [0, 1, 0, 1])  # set 3rd hub (id 2) channel 2 & 4 on, 1 & 3 off. Total 3 hubs in 
         the chain.
+        >>> set_hub_chain([1, 1, 1], [0, 0, 0], [0, 0, 0, 0], pipelined=True)  # returns [] when all hubs acked
     """
     if len(args) > total_hubs:
         raise IndexError(f"trying to set hub outside range. total hubs: {total_hubs}")
+    if pipelined:
+        return _set_hub_chain_pipelined(args)
     for i in reversed(range(len(args))):  # from furtherest chain avoid been cycled by upstream
         if args[i]:
             if i == 0:  # daisy chain root hub
                 args[i].insert(DC.DC_CH, True)  # channel to chain next hub should always set on
                 set_hub(args[i])
                 continue
-            is_rtn_received = False
             if _debug: print(f"DaisyChain: SET_HUB: args: {args}, i: {i}")
-            if len(args[i]) > len(DC.CHANNEL_MSKS) - 1 and i + 1 < total_hubs:
-                raise IndexError(f"Too many channels to set hub: {i}. (mid-chain hubs need one channel for next hub)")
-            _uart.send_downstream(DC.make_data(DC.SET_HUB, i,
-                                               sum([ch for ch_on, ch in zip(args[i], DC.CHANNEL_MSKS) if ch_on])))
-            start_ms = time.ticks_ms()
-            while time.ticks_ms() - start_ms < DC.BROADCAST_TIMEOUT:  # may take longer than 1s to reset ic
-                if len(_uart.q_msg) > 0:
-                    msg = _uart.q_msg.popleft()
-                    if hasattr(msg, "cmd"):
-                        if msg.cmd == DC.SET_HUB_RTN and int(msg.hub_no) == int(i) and msg.hub_stat == DC.ACK:
-                            if _debug: print(f"DaisyChain: SET_HUB_RTN message: {msg}")
-                            is_rtn_received = True
-                            break
-            if is_rtn_received:
+            rid = _uart.request(DC.SET_HUB, i, _chain_stat(i, args[i]))
+            replies = _uart.wait(rid, DC.BROADCAST_TIMEOUT)  # may take longer than 1s to reset ic
+            if replies and replies[0].hub_stat == DC.ACK:
+                if _debug: print(f"DaisyChain: SET_HUB_RTN message: {replies[0]}")
                 continue
-            raise ValueError(f"trying to set hub: {i} in chain with no ack response")
+            raise ValueError(f"trying to set hub: {i} in chain with no ack response (request id: {rid})")
+
+
+def _set_hub_chain_pipelined(args: tuple) -> list:
+    """
+    send all SET_HUB frames back to back, furtherest hub first so every relaying hub forwards downstream frames
+    before resetting itself. Root hub resets while remote hubs do, then acks are collected as they arrive.
+    """
+    stats = [(i, _chain_stat(i, args[i])) for i in reversed(range(1, len(args))) if args[i]]  # validate all first
+    requests = []
+    for i, stat in stats:
+        if _debug: print(f"DaisyChain: SET_HUB pipelined: hub: {i}, stat: {stat}")
+        requests.append((i, _uart.request(DC.SET_HUB, i, stat), time.ticks_add(time.ticks_ms(), DC.BROADCAST_TIMEOUT)))
+    failed = []
+    if args and args[0]:
+        root_lst = list(args[0])
+        if len(root_lst) < len(DC.CHANNEL_MSKS):
+            root_lst.insert(DC.DC_CH, True)  # channel to chain next hub should always set on
+        try:
+            set_hub(root_lst)
+        except OSError:
+            failed.append(0)
+    for i, rid, deadline in requests:  # acks arriving meanwhile wait in their own pending slot
+        replies = _uart.wait(rid, max(0, time.ticks_diff(deadline, time.ticks_ms())))
+        if _debug: print(f"DaisyChain: SET_HUB_RTN hub: {i}, request id: {rid}, replies: {replies}")
+        if not replies or replies[0].hub_stat != DC.ACK:
+            failed.append(i)
+    return sorted(failed)
 
 
 def set_hubs(on_off: bool) -> None:
     """
-    set all hubs on chain to all on or all off state
+    set all hubs on chain to all on or all off state, in one broadcast chain traversal
+    """
+    applied, failed = set_hub_group([on_off] * len(DC.CHANNEL_MSKS))
+    if failed:
+        raise ValueError(f"trying to set hubs: {failed} of {applied + failed} hubs in chain failed")
+
+
+def set_groups(mask: int) -> None:
+    """
+    set multicast group membership of this hub as bitmask of 8 groups. e.g. set_groups(0x03) joins groups 0 and 1
+    """
+    global hub_groups
+    hub_groups = mask & DC.GROUP_ALL
+
+
+def set_hub_group(on_off_lst: list, groups=DC.GROUP_ALL) -> tuple:
+    """
+    set channels of every hub in groups bitmask (all hubs by default) with one multicast chain traversal. Channel used
+    for daisy chain next hub stays on.
+    return (hubs applied, hubs failed)
+    e.g.:
+        >>> set_hub_group([0, 0, 0, 0])  # all ports off across the chain
+    """
+    stat = sum([ch for ch_on, ch in zip(on_off_lst, DC.CHANNEL_MSKS) if ch_on])
+    return _multicast(DC.SET_HUB_MCAST, stat, groups, lambda: set_hub_mask(_chain_set_mask(stat)))
+
+
+def set_switch_group(ch_no: int, groups=DC.GROUP_ALL) -> tuple:
+    """
+    set usb switch position of every hub in groups bitmask (all hubs by default) with one multicast chain traversal.
+    return (hubs applied, hubs failed)
+    """
+    if ch_no not in [0, 1]:
+        raise ValueError(f'cannot switch cha to {ch_no} (ch{ch_no+1}). Only 0, 1 (2 channels) supported')
+    return _multicast(DC.SET_SWITCH_MCAST, ch_no, groups, lambda: set_switch(ch_no, 'mcast'))
+
+
+def _multicast(cmd: int, stat: int, groups: int, apply_local) -> tuple:
+    """
+    send multicast downstream, apply on this hub meanwhile, then add up the single gathered RTN of downstream hubs
+    """
+    rid = _uart.request(cmd, groups, stat) if hub_chain_id == 0 and total_hubs > 1 else None
+    applied = failed = 0
+    if hub_groups & groups:
+        try:
+            apply_local()
+            applied = 1
+        except (OSError, ValueError):
+            failed = 1
+    if rid is not None:
+        replies = _uart.wait(rid, DC.BROADCAST_TIMEOUT)
+        if not replies:
+            raise ValueError(f"multicast to downstream hubs with no ack response (request id: {rid})")
+        applied += replies[0].hub_no
+        failed += replies[0].hub_stat
+    return applied, failed
+
+
+def _chain_set_mask(hub_stat: int) -> int:
+    """
+    decode SET_HUB hub stat field into this hub channel on bitmask
+    """
+    mask = hub_stat & 0x0F
+    if hub_chain_id + 1 < total_hubs:
+        mask |= DC.CHANNEL_MSKS[DC.DC_CH]  # channel to chain next hub should always set on
+    return mask
+
+
+def set_switch_chain(*args) -> list:
+    """
+    set usb switch position of hubs in chain, args represents hub index in order, each a channel 0 / 1 or None to
+    leave that hub unchanged. All SET_SWITCH frames are sent back to back so every mux moves within one chain pass.
+    return list of hub ids failed to ack within DC.END_CHAIN_TIMEOUT
+    e.g.:
+        >>> set_switch_chain(None, 1, None, 1)  # hub 1 and 3 to ch2, hub 0 and 2 unchanged
+    """
+    if len(args) > total_hubs:
+        raise IndexError(f"trying to set switch outside range. total hubs: {total_hubs}")
+    for ch_no in args:  # validate all first
+        if ch_no is not None and ch_no not in [0, 1]:
+            raise ValueError(f'cannot switch cha to {ch_no} (ch{ch_no+1}). Only 0, 1 (2 channels) supported')
+    requests = []
+    for i in reversed(range(1, len(args))):
+        if args[i] is not None:
+            requests.append((i, _uart.request(DC.SET_SWITCH, i, args[i])))
+    if args and args[0] is not None:
+        set_switch(args[0], 'chain')
+    deadline = time.ticks_add(time.ticks_ms(), DC.END_CHAIN_TIMEOUT)
+    failed = []
+    for i, rid in requests:
+        replies = _uart.wait(rid, max(0, time.ticks_diff(deadline, time.ticks_ms())))
+        if _debug: print(f"DaisyChain: SET_SWITCH_RTN hub: {i}, request id: {rid}, replies: {replies}")
+        if not replies or replies[0].hub_stat != DC.ACK:
+            failed.append(i)
+    return sorted(failed)
+
+
+def get_switches() -> dict:
+    """
+    get usb switch position of all hubs in chain as dict of hub id: channel. GET_SWITCH requests to every downstream
+    hub are sent back to back, replies collected as they arrive
+    """
+    if hub_chain_id < 0:
+        raise ValueError("HUB in standalone mode. Connect daisy chain and use dc_broadcast before use this function.")
+    requests = [(i, _uart.request(DC.GET_SWITCH, i, DC.DATA_DEF)) for i in range(hub_chain_id + 1, total_hubs)]
+    sw_dict = {hub_chain_id: get_switch()}
+    deadline = time.ticks_add(time.ticks_ms(), DC.END_CHAIN_TIMEOUT)
+    missing = []
+    for i, rid in requests:
+        replies = _uart.wait(rid, max(0, time.ticks_diff(deadline, time.ticks_ms())))
+        if not replies:
+            missing.append(i)
+            continue
+        if _debug: print(f"DaisyChain: GET_SWITCH_RTN message: {replies[0]}")
+        sw_dict[i] = _decode_switch_stat(i, replies[0].hub_stat)
+    if missing:
+        raise ValueError(f"hubs: {missing} not responding within: {DC.END_CHAIN_TIMEOUT}ms")
+    return sw_dict
+
+
+def get_switch_chain(hub_id: int) -> int:
+    """
+    get usb switch position of a hub on daisy chain
     """
-    bool_lst = [[on_off] * (len(DC.CHANNEL_MSKS) - 1) for i in range(total_hubs - 1)]
-    bool_lst.append([on_off] * len(DC.CHANNEL_MSKS))
-    set_hub_chain(*bool_lst)
+    if hub_id == hub_chain_id:
+        return get_switch()
+    rid = _uart.request(DC.GET_SWITCH, hub_id, DC.DATA_DEF)
+    replies = _uart.wait(rid, DC.END_CHAIN_TIMEOUT)
+    if not replies:
+        raise ValueError(f"no downstream hub responding within: {DC.END_CHAIN_TIMEOUT}ms (request id: {rid})")
+    return _decode_switch_stat(hub_id, replies[0].hub_stat)
+
+
+def get_total_hubs_chain(hub_id: int) -> int:
+    """
+    get total hubs number seen by a hub on daisy chain, a mismatch to root total_hubs means that hub missed last
+    discovery
+    """
+    if hub_id == hub_chain_id:
+        return total_hubs
+    rid = _uart.request(DC.GET_TOT_HUBS, hub_id, DC.DATA_DEF)
+    replies = _uart.wait(rid, DC.END_CHAIN_TIMEOUT)
+    if not replies:
+        raise ValueError(f"no downstream hub responding within: {DC.END_CHAIN_TIMEOUT}ms (request id: {rid})")
+    return replies[0].hub_stat
+
+
+def _decode_switch_stat(hub_id: int, hub_stat: int) -> int:
+    """
+    decode GET_SWITCH_RTN hub stat field into switch channel
+    """
+    if hub_stat == DC.ERROR:
+        raise ValueError(f"hub id:{hub_id} internal error. ICs selection or Relay selection error")
+    return hub_stat
+
+
+def _encode_switch_stat() -> int:
+    """
+    encode this hub switch position into GET_SWITCH_RTN hub stat field. DC.ERROR when selection lines disagree
+    """
+    try:
+        return get_switch()
+    except ValueError:
+        return DC.ERROR
 
 
 def get_hub() -> tuple:
     """
     get usb hub current channels status in tuple of bools.
     """
-    data = _hub._br(HUBAddr.PORT_DISABLE_SELF.addr)[1]
-    return not bool(data & HUBAddr.PORT_MSK_1), not bool(data & HUBAddr.PORT_MSK_2), \
-        not bool(data & HUBAddr.PORT_MSK_3), not bool(data & HUBAddr.PORT_MSK_4)
+    mask = get_hub_mask()
+    return bool(mask & DC.CHANNEL_MSK_1), bool(mask & DC.CHANNEL_MSK_2), bool(mask & DC.CHANNEL_MSK_3), \
+        bool(mask & DC.CHANNEL_MSK_4)
+
+
+def get_hub_mask() -> int:
+    """
+    get usb hub channels on bitmask (DC.CHANNEL_MSKS, bit 0 channel 1)
+    """
+    _hw_ready()
+    return (~_hub.read_reg(HUBAddr.PORT_DISABLE_SELF.addr) >> 1) & 0x0F
 
 
 def get_hubs() -> dict:
     """
-    get available hubs all port status in dict
+    get available hubs all port status in dict. One GET_HUBS sweep travels down the chain once, every downstream hub
+    answers with its own GET_HUBS_RTN as the sweep passes
     """
     if hub_chain_id < 0:
         raise ValueError("HUB in standalone mode. Connect daisy chain and use dc_broadcast before use this function.")
-    hub_dict = {}
-    for id in range(total_hubs):
-        hub_dict[id] = get_hub_chain(id)
+    hub_dict = {hub_chain_id: get_hub_chain(hub_chain_id)}
+    if total_hubs <= hub_chain_id + 1:
+        return hub_dict
+    rid = _uart.request(DC.GET_HUBS, hub_chain_id, DC.DATA_DEF)
+    for msg in _uart.wait(rid, DC.END_CHAIN_TIMEOUT, total_hubs - hub_chain_id - 1):
+        if _debug: print(f"DaisyChain: GET_HUBS_RTN message: {msg}")
+        hub_dict[msg.hub_no] = _decode_chain_stat(msg.hub_no, msg.hub_stat)
+    if len(hub_dict) < total_hubs:
+        missing = [i for i in range(total_hubs) if i not in hub_dict]
+        raise ValueError(f"hubs: {missing} not responding within: {DC.END_CHAIN_TIMEOUT}ms (request id: {rid})")
     return hub_dict
 
 
@@ -172,54 +764,410 @@ def get_hub_chain(hub_id: int) -> list:
     """
     if hub_id == hub_chain_id:  # when querying current hub, not returning the channel used for daisy chain
         return [x for i, x in enumerate(get_hub()) if i != DC.DC_CH]
-    _uart.send_downstream(DC.make_data(DC.GET_HUB, hub_id, DC.DATA_DEF))
-    start_ms = time.ticks_ms()
-    while time.ticks_ms() - start_ms < DC.END_CHAIN_TIMEOUT:
-        if len(_uart.q_msg) > 0:
-            msg = _uart.q_msg.popleft()
-            if hasattr(msg, "cmd"):
-                if msg.cmd == DC.GET_HUB_RTN:
-                    if _debug: print(f"DaisyChain: get downstream chain stat: {msg}")
-                    assert msg.hub_no == hub_id
-                    if msg.hub_stat == DC.ERROR:
-                        raise OSError(f"hub id:{hub_id} not activated yet. Please check it it is connected")
-                    ch1to3 = [bool(DC.CHANNEL_MSK_1 & msg.hub_stat), bool(DC.CHANNEL_MSK_2 & msg.hub_stat),
-                              bool(DC.CHANNEL_MSK_3 & msg.hub_stat)]
-                    if hub_id + 1 == total_hubs:  # querying hub is end of chain, have all 4 ports available
-                        ch1to3.append(bool(DC.CHANNEL_MSK_4 & msg.hub_stat))
-                    return ch1to3
-    raise ValueError(f"no downstream hub responding within: {DC.END_CHAIN_TIMEOUT}ms")
+    rid = _uart.request(DC.GET_HUB, hub_id, DC.DATA_DEF)
+    replies = _uart.wait(rid, DC.END_CHAIN_TIMEOUT)
+    if not replies:
+        raise ValueError(f"no downstream hub responding within: {DC.END_CHAIN_TIMEOUT}ms (request id: {rid})")
+    if _debug: print(f"DaisyChain: get downstream chain stat: {replies[0]}")
+    assert replies[0].hub_no == hub_id
+    return _decode_chain_stat(hub_id, replies[0].hub_stat)
+
+
+def _decode_chain_stat(hub_id: int, hub_stat: int) -> list:
+    """
+    decode GET_HUB_RTN / GET_HUBS_RTN hub stat field into channel on/off list
+    """
+    if hub_stat == DC.ERROR:
+        raise OSError(f"hub id:{hub_id} not activated yet. Please check it it is connected")
+    ch1to3 = [bool(DC.CHANNEL_MSK_1 & hub_stat), bool(DC.CHANNEL_MSK_2 & hub_stat), bool(DC.CHANNEL_MSK_3 & hub_stat)]
+    if hub_id + 1 == total_hubs:  # querying hub is end of chain, have all 4 ports available
+        ch1to3.append(bool(DC.CHANNEL_MSK_4 & hub_stat))
+    return ch1to3
+
+
+def _encode_chain_stat() -> int:
+    """
+    encode this hub channels into GET_HUB_RTN hub stat field. DC.ERROR when hub not activated yet
+    """
+    try:
+        stat = get_hub_mask()
+    except OSError:
+        if _debug: print("DaisyChain: calling get_hub error. Possibly hub not activated yet")
+        return DC.ERROR
+    if hub_chain_id + 1 != total_hubs:  # excluding the channel used for daisy chain next hub
+        stat &= ~DC.CHANNEL_MSKS[DC.DC_CH]
+    return stat
+
+
+class VBUSMonitor(object):
+    """
+    timer driven VBus sampler of both switch channels. Each tick averages HW.VBUS_OVERSAMPLE adc reads per channel
+    into preallocated ring buffers and tracks threshold crossings, integer only so the callback never allocates.
+    Runs on main core, daisy chain relay thread on the other core is not affected
+    """
+    OK = 0
+    LOW = 1
+    HIGH = 2
+    STATES = ('ok', 'low', 'high')
+
+    def __init__(self, adcs: tuple, size=HW.VBUS_RING_LEN, evt_size=HW.VBUS_EVT_LEN) -> None:
+        self.adcs = adcs
+        self.size = size
+        self.ring = [array('H', bytes(2 * size)) for _ in adcs]
+        self.idx = 0
+        self.count = 0
+        self.state = bytearray(len(adcs))
+        self.crossings = [[0, 0, 0] for _ in adcs]  # per channel ok, low, high entries
+        self.evt_size = evt_size
+        self.evt_ts = array('I', bytes(4 * evt_size))
+        self.evt_ch = bytearray(evt_size)
+        self.evt_state = bytearray(evt_size)
+        self.evt_raw = array('H', bytes(2 * evt_size))
+        self.evt_idx = 0
+        self.evt_count = 0
+        self.overruns = 0  # events dropped since last read
+        self.low_raw = _v_adc(HW.VBUS_MIN_V)
+        self.high_raw = _v_adc(HW.VBUS_MAX_V)
+        self.timer = None
+        self._tick_cb = self._tick  # bound once, no allocation per tick
+
+    def start(self, hz=HW.VBUS_SAMPLE_HZ) -> None:
+        self.stop()
+        self.timer = Timer(freq=hz, mode=Timer.PERIODIC, callback=self._tick_cb)
+
+    def stop(self) -> None:
+        if self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+
+    def set_thresholds(self, low_v: float, high_v: float) -> None:
+        self.low_raw = _v_adc(low_v)
+        self.high_raw = _v_adc(high_v)
+
+    def _tick(self, _) -> None:
+        idx = self.idx
+        for ch in range(len(self.adcs)):
+            adc = self.adcs[ch]
+            acc = 0
+            for _ in range(HW.VBUS_OVERSAMPLE):
+                acc += adc.read_u16()
+            raw = acc // HW.VBUS_OVERSAMPLE
+            self.ring[ch][idx] = raw
+            state = self.LOW if raw < self.low_raw else self.HIGH if raw > self.high_raw else self.OK
+            if state != self.state[ch]:
+                self.state[ch] = state
+                self.crossings[ch][state] += 1
+                self._event(ch, state, raw)
+        self.idx = idx + 1 if idx + 1 < self.size else 0
+        if self.count < self.size:
+            self.count += 1
+
+    def _event(self, ch: int, state: int, raw: int) -> None:
+        i = self.evt_idx
+        self.evt_ts[i] = time.ticks_ms()
+        self.evt_ch[i] = ch
+        self.evt_state[i] = state
+        self.evt_raw[i] = raw
+        self.evt_idx = i + 1 if i + 1 < self.evt_size else 0
+        if self.evt_count < self.evt_size:
+            self.evt_count += 1
+        else:
+            self.overruns += 1
+
+    def samples(self, ch: int) -> list:
+        """
+        channel raw samples oldest first
+        """
+        start = (self.idx - self.count) % self.size
+        ring = self.ring[ch]
+        return [ring[(start + i) % self.size] for i in range(self.count)]
+
+    def stats(self, reset=False) -> dict:
+        irq = disable_irq()  # consistent snapshot against the sampling timer
+        idx, count = self.idx, self.count
+        rings = [bytes(r) for r in self.ring]
+        evt_idx, evt_count = self.evt_idx, self.evt_count
+        events = [(self.evt_ts[i], self.evt_ch[i], self.evt_state[i], self.evt_raw[i])
+                  for i in ((evt_idx - evt_count + j) % self.evt_size for j in range(evt_count))]
+        crossings = [list(c) for c in self.crossings]
+        overruns = self.overruns
+        if reset:
+            self.count = self.evt_count = self.overruns = 0
+            self.crossings = [[0, 0, 0] for _ in self.adcs]
+        enable_irq(irq)
+        res = {'events': [(ts, ch + 1, self.STATES[st], _adc_v(raw)) for ts, ch, st, raw in events],
+               'overruns': overruns}
+        start = (idx - count) % self.size
+        for ch, raw_bytes in enumerate(rings):
+            ring = array('H', raw_bytes)
+            vals = [ring[(start + i) % self.size] for i in range(count)]
+            ch_stat = {'n': count, 'low': crossings[ch][self.LOW], 'high': crossings[ch][self.HIGH]}
+            if count:
+                mean = sum(vals) / count
+                ch_stat.update({'min': _adc_v(min(vals)), 'max': _adc_v(max(vals)), 'mean': _adc_v(mean),
+                                'rms': _adc_v((sum(v * v for v in vals) / count) ** 0.5)})
+            res[ch + 1] = ch_stat
+        return res
+
+
+class PerfStats(object):
+    """
+    fixed memory performance counters and log2 latency histograms, preallocated at boot so updating them never
+    allocates. Histogram bucket b counts values in [2^(b-1), 2^b) us, bucket 0 counts 0 us, last bucket open ended
+    """
+    COUNTERS = ('rx_us', 'rx_ds', 'tx_us', 'tx_ds', 'relayed', 'q_msg_drop', 'q_local_drop', 'sched_full',
+                'timeouts', 'late', 'errors', 'q_msg_hw', 'q_local_hw', 'pending_hw', 'gc_runs', 'gc_auto',
+                'alloc_reads', 'mem_free', 'mem_free_min')
+    RX_US, RX_DS, TX_US, TX_DS, RELAYED, Q_MSG_DROP, Q_LOCAL_DROP, SCHED_FULL, TIMEOUTS, LATE, ERRORS, Q_MSG_HW, \
+        Q_LOCAL_HW, PENDING_HW, GC_RUNS, GC_AUTO, ALLOC_READS, MEM_FREE, MEM_FREE_MIN = range(19)
+    HISTS = ('relay_us', 'ack_rtt_us', 'i2c_us', 'hub_reset_us', 'gc_us')
+    RELAY, ACK_RTT, I2C, HUB_RESET, GC = range(5)
+    BUCKETS = 24
+    # flat field order, index carried by GET_STATS: counters then per histogram count, p50, p99 and max
+    FIELDS = COUNTERS + ('crc_drops', 'discarded') + tuple(f'{h}_{k}' for h in HISTS for k in ('n', 'p50', 'p99',
+                                                                                              'max'))
+    # default fields of get_stats_chain, one reply frame per hub each
+    SWEEP = ('relayed', 'q_local_drop', 'timeouts', 'errors', 'crc_drops', 'mem_free_min', 'relay_us_p99',
+             'relay_us_max', 'ack_rtt_us_p99')
+
+    def __init__(self) -> None:
+        self.cnt = array('I', bytes(4 * len(self.COUNTERS)))
+        self.hist = [array('I', bytes(4 * self.BUCKETS)) for _ in self.HISTS]
+        self.hist_max = array('I', bytes(4 * len(self.HISTS)))
+        self.alloc_check = False  # gc.mem_free walks the heap, per read allocation check only while profiling
+
+    def inc(self, idx: int, n=1) -> None:
+        self.cnt[idx] += n
+
+    def high(self, idx: int, val: int) -> None:
+        if val > self.cnt[idx]:
+            self.cnt[idx] = val
+
+    def mem(self, free: int) -> int:
+        """
+        record free heap bytes sample. A rise since the last sample not made by gc_collect() was an automatic
+        collection, pausing whichever core allocated at the time
+        """
+        cnt = self.cnt
+        if free > cnt[self.MEM_FREE] and cnt[self.MEM_FREE]:
+            cnt[self.GC_AUTO] += 1
+        cnt[self.MEM_FREE] = free
+        if free < cnt[self.MEM_FREE_MIN] or not cnt[self.MEM_FREE_MIN]:
+            cnt[self.MEM_FREE_MIN] = free
+        return free
+
+    def observe(self, idx: int, us: int) -> None:
+        bucket = 0
+        val = us
+        while val and bucket < self.BUCKETS - 1:
+            val >>= 1
+            bucket += 1
+        self.hist[idx][bucket] += 1
+        if us > self.hist_max[idx]:
+            self.hist_max[idx] = us
+
+    def _pct(self, idx: int, pct: int) -> int:
+        """
+        upper bound in us of bucket holding the pct percentile, capped at max seen
+        """
+        hist = self.hist[idx]
+        total = sum(hist)
+        if not total:
+            return 0
+        rank = (total * pct + 99) // 100
+        seen = 0
+        for bucket in range(self.BUCKETS):
+            seen += hist[bucket]
+            if seen >= rank:
+                return min((1 << bucket) - 1 if bucket else 0, self.hist_max[idx])
+        return self.hist_max[idx]
+
+    def read(self, framers=(), reset=False) -> dict:
+        res = {name: self.cnt[i] for i, name in enumerate(self.COUNTERS)}
+        res['crc_drops'] = sum([fr.crc_drops for fr in framers])
+        res['discarded'] = sum([fr.discarded for fr in framers])
+        for i, name in enumerate(self.HISTS):
+            res[name] = {'n': sum(self.hist[i]), 'p50': self._pct(i, 50), 'p99': self._pct(i, 99),
+                         'max': self.hist_max[i], 'buckets': list(self.hist[i])}
+        if reset:
+            for arr in [self.cnt, self.hist_max] + self.hist:
+                for i in range(len(arr)):
+                    arr[i] = 0
+            for fr in framers:
+                fr.crc_drops = fr.discarded = 0
+        return res
+
+    def field(self, idx: int, framers=()) -> int:
+        """
+        one stat by FIELDS index
+        """
+        n_cnt = len(self.COUNTERS)
+        if idx < n_cnt:
+            return self.cnt[idx]
+        if idx == n_cnt:
+            return sum([fr.crc_drops for fr in framers])
+        if idx == n_cnt + 1:
+            return sum([fr.discarded for fr in framers])
+        hist, kind = divmod(idx - n_cnt - 2, 4)
+        if kind == 0:
+            return sum(self.hist[hist])
+        if kind == 3:
+            return self.hist_max[hist]
+        return self._pct(hist, 50 if kind == 1 else 99)
+
+
+def gc_collect() -> int:
+    """
+    collect garbage now, pause timed into gc_us histogram. Receive loop runs it when idle and heap free below
+    HW.GC_LOW_WATER, so automatic collections do not land in the middle of relaying.
+    return free heap bytes
+    """
+    start_us = time.ticks_us()
+    gc.collect()
+    _perf.observe(PerfStats.GC, time.ticks_diff(time.ticks_us(), start_us))
+    _perf.cnt[PerfStats.GC_RUNS] += 1
+    _perf.cnt[PerfStats.MEM_FREE] = 0  # rise after own collection not counted as automatic
+    return _perf.mem(gc.mem_free())
+
+
+def alloc_check(en: bool) -> None:
+    """
+    count receive loop reads that allocated (heap free dropped while dispatching frames, alloc_reads in stats).
+    Costs a heap walk per read, profiling only. Main core allocating at the same time is counted too
+    """
+    _perf.alloc_check = en
+
+
+def stats(reset=False) -> dict:
+    """
+    performance counters and latency histograms of this hub: frames in / out per direction, relayed frames, queue
+    drops and high water marks, request timeouts, late and error replies, CRC drops and discarded bytes, plus
+    histograms (count, p50, p99, max in us) of relay latency, ack round trip, I2C transaction and hub reset time
+    """
+    return _perf.read(_uart.framers, reset)
+
+
+def get_stats_chain(fields=PerfStats.SWEEP) -> dict:
+    """
+    stats fields (names of PerfStats.FIELDS, all of them for everything) of every hub as {hub id: {field: value}}.
+    One GET_STATS sweep per field, all sent back to back, every downstream hub answering each with one frame. Remote
+    values are minifloat encoded on the wire, within 12.5% above 8
+    """
+    if hub_chain_id < 0:
+        raise ValueError("HUB in standalone mode. Connect daisy chain and use dc_broadcast before use this function.")
+    idxs = [PerfStats.FIELDS.index(name) for name in fields]
+    hub_dict = {hub_chain_id: {name: _perf.field(idx, _uart.framers) for name, idx in zip(fields, idxs)}}
+    hubs = total_hubs - hub_chain_id - 1
+    if hubs <= 0:
+        return hub_dict
+    rids = [_uart.request(DC.GET_STATS, hub_chain_id, idx) for idx in idxs]
+    # every reply passes the link next to this hub: budget all of them at link speed on top of end of chain timeout
+    frame_ms = DC.MSG_LEN * 10 * 1000 // _uart.baud + 1
+    deadline = time.ticks_add(time.ticks_ms(), DC.END_CHAIN_TIMEOUT + 2 * len(rids) * hubs * frame_ms)
+    for rid, name in zip(rids, fields):
+        for msg in _uart.wait(rid, max(0, time.ticks_diff(deadline, time.ticks_ms())), hubs):
+            hub_dict.setdefault(msg.hub_no, {})[name] = DC.from_minifloat(msg.hub_stat)
+    missing = [i for i in range(total_hubs) if len(hub_dict.get(i, ())) < len(fields)]
+    if missing:
+        raise ValueError(f"hubs: {missing} not responding with all stats fields (request ids: {rids[0]} - {rids[-1]})")
+    return hub_dict
 
 
 class HUBI2C(object):
     """
     USB HUB control
     """
-    MAX_BLOCK = 32  # max block read / write size for USB2514B
+    MAX_BLOCK = HUBAddr.MAX_BLOCK
 
     def __init__(self, scl_pin=HW.HUB_SCL, sda_pin=HW.HUB_SDA, frequency=400000) -> None:
         self.i2c = I2C(0, scl=Pin(scl_pin), sda=Pin(sda_pin), freq=frequency)
-        self._init_hub()
+        self.shadow = None  # register values known to be in hub. None until first reset (state unknown at boot)
+        self.attached = False
+        self.reg_buf = bytearray(1)  # single register access buffers, no allocation per port change
+        self.rd_buf = bytearray(2)
+        self.wr_buf = bytearray(3)
+
+    def start(self) -> None:
+        """
+        write configuration and attach, hub enumerates upstream from here. A hub still attached from before a soft
+        reboot takes no config until reset
+        """
+        try:
+            self._init_hub()
+        except OSError:
+            self.reset()
         self.attach()
-    
+
+
     def _init_hub(self) -> None:
         """
-        Configure hub default values. t5 stage in SMBus.
+        Configure hub default values. t5 stage in SMBus. Writes the precompiled register image in block bursts; once
+        register state is known (after reset) only registers differing from power-on values. Either verified by read
+        back, mismatches rewritten once
+        """
+        bursts = HUBAddr.CFG_FULL_BURSTS if self.shadow is None else HUBAddr.CFG_BURSTS
+        for burst in bursts:
+            self._write(burst)
+        self.shadow = bytearray(HUBAddr.CFG_IMAGE)
+        bad = self.verify()
+        if bad:
+            if _debug: print(f"HUB: register read back mismatch at: {bad}, rewriting")
+            for addr in bad:
+                self._bw(addr, [HUBAddr.CFG_IMAGE[addr]])
+            bad = self.verify()
+            if bad:
+                raise OSError(f"hub registers: {bad} not taking configured values")
+
+    def verify(self) -> list:
         """
-        for reg2init in HUBAddr.INIT_DEFAULT:
-            self._bw(reg2init.addr, [reg2init.default_val])
-        for reg2init in HUBAddr.MFG_AUX_DEFAULT:
-            self._bw(reg2init.addr, [reg2init.default_val])
-        for mfg in HUBAddr.MFG_DEFAULT:
-            self._bw_lot(mfg.addr, mfg.default_val)
+        Bulk read back configured register span, return addresses differing from configuration image
+        """
+        bad = []
+        for start in range(0, HUBAddr.CFG_SPAN, self.MAX_BLOCK):
+            byte_ct = min(self.MAX_BLOCK, HUBAddr.CFG_SPAN - start)
+            data = self._br(start, byte_ct + 1)
+            if data[1:byte_ct + 1] != HUBAddr.CFG_IMAGE[start:start + byte_ct]:
+                bad.extend([start + i for i in range(byte_ct) if data[i + 1] != HUBAddr.CFG_IMAGE[start + i]])
+        return bad
+
+    def _write(self, data: bytes) -> None:
+        start_us = time.ticks_us()
+        self.i2c.writeto(HUBAddr.SLAVE, data)
+        _perf.observe(PerfStats.I2C, time.ticks_diff(time.ticks_us(), start_us))
 
     def _br(self, reg_addr: int, byte_ct=33) -> bytearray:
         """
         Block read. byte_ct max 33 (i.e. ct + max 32 bytes data)
         """
+        start_us = time.ticks_us()
         buf_reg = bytes([reg_addr])
         self.i2c.writeto(HUBAddr.SLAVE, buf_reg, False)
-        return self.i2c.readfrom(HUBAddr.SLAVE, byte_ct)
+        data = self.i2c.readfrom(HUBAddr.SLAVE, byte_ct)
+        _perf.observe(PerfStats.I2C, time.ticks_diff(time.ticks_us(), start_us))
+        return data
+
+    def read_reg(self, reg_addr: int) -> int:
+        """
+        read one register through preallocated buffers
+        """
+        start_us = time.ticks_us()
+        self.reg_buf[0] = reg_addr
+        self.i2c.writeto(HUBAddr.SLAVE, self.reg_buf, False)
+        self.i2c.readfrom_into(HUBAddr.SLAVE, self.rd_buf)  # count byte, value
+        _perf.observe(PerfStats.I2C, time.ticks_diff(time.ticks_us(), start_us))
+        return self.rd_buf[1]
+
+    def write_reg(self, reg_addr: int, val: int) -> None:
+        """
+        write one register through preallocated buffer
+        """
+        buf = self.wr_buf
+        buf[0] = reg_addr
+        buf[1] = 1
+        buf[2] = val
+        self._write(buf)
+        if self.shadow is not None:
+            self.shadow[reg_addr] = val
 
     def _bw(self, reg_addr: int, bytes2write: list) -> None:
         """
@@ -227,84 +1175,167 @@ class HUBI2C(object):
         """
         data = [reg_addr, len(bytes2write)]
         data.extend(bytes2write)
-        bw_data = bytes(data)
-        self.i2c.writeto(HUBAddr.SLAVE, bw_data)
+        self._write(bytes(data))
+        if self.shadow is not None:
+            self.shadow[reg_addr:reg_addr + len(bytes2write)] = bytes(bytes2write)
 
-    def _bw_lot(self, ref_addr: list, bytes2write: list) -> None:
-        """
-        Block write a lot longer than expected
-        """
-        if len(bytes2write) > 32:
-            chunks = [bytes2write[i : i+32] for i in range(0, len(bytes2write), 32)]
-            for idx in range(len(chunks)):
-                self._bw(ref_addr[idx], chunks[idx])
-        else:
-            self._bw(ref_addr[0], bytes2write)  # Blindly take 1st 
-   
     def attach(self) -> None:
         """
         Aply hub configs and make it online
         """
-        self._bw(HUBAddr.STAT_CMD.addr, [0x01])
+        self.write_reg(HUBAddr.STAT_CMD.addr, 0x01)
+        self.attached = True
 
-    def reset(self, seconds=1) -> None:
+    def reset(self, hold_ms=HW.HUB_RST_HOLD_MS, settle_ms=HW.HUB_RST_SETTLE_MS) -> None:
         """
-        Reset HUB
+        Reset HUB. Registers return to power-on values, then only those differing from config are written
         """
+        start_us = time.ticks_us()
         _hub_rst.value(HW.HIGH)
-        time.sleep(seconds)
+        time.sleep_ms(hold_ms)
         _hub_rst.value(HW.LOW)
-        time.sleep(seconds/2)
+        time.sleep_ms(settle_ms)
+        self.attached = False
+        self.shadow = bytearray(HUBAddr.POR_IMAGE)
         self._init_hub()
+        _perf.observe(PerfStats.HUB_RESET, time.ticks_diff(time.ticks_us(), start_us))
+
+    def set_ports(self, disable_mask: int) -> bool:
+        """
+        Apply PORT_DISABLE_SELF mask. No-op when hub attached with the same mask already. Hub latches its config on
+        attach, so a changed mask takes a reset (not a second full init) before writing it.
+        return True when hub reconfigured
+        """
+        if self.attached and self.shadow is not None and self.shadow[HUBAddr.PORT_DISABLE_SELF.addr] == disable_mask:
+            return False
+        if self.attached or self.shadow is None:
+            self.reset()
+        if self.shadow[HUBAddr.PORT_DISABLE_SELF.addr] != disable_mask:
+            self.write_reg(HUBAddr.PORT_DISABLE_SELF.addr, disable_mask)
+        self.attach()
+        return True
+
+
+class DCFramer(object):
+    """
+    Daisy chain stream framer over one uart. Buffers received bytes, resyncs on DC.DC_HEADER and pulls every complete
+    CRC valid frame out of a read, decoded in place into its DCView (valid until next call of next)
+    """
+    def __init__(self, uart, size=HW.RX_BUF_LEN) -> None:
+        self.uart = uart
+        self.buf = bytearray(size)
+        mv = memoryview(self.buf)
+        # uart reads land straight in buf behind the partial frame left unparsed (under DC.MSG_LEN bytes), one
+        # memoryview slice per partial length made here, as slicing per read would allocate
+        self.heads = tuple(mv[i:] for i in range(DC.MSG_LEN))
+        self.start = 0  # first unparsed byte
+        self.end = 0  # end of received bytes
+        self.resyncing = False
+        self.discarded = 0  # bytes dropped while resyncing
+        self.recovered = 0  # frames found right after discarding bytes
+        self.crc_drops = 0  # header matched frames dropped for CRC mismatch
+        self.msg = DCView()
+
+    def feed(self) -> int:
+        """
+        read available uart bytes into buffer, behind the unparsed partial frame moved to buffer front first. Nothing
+        read while complete frames are left unparsed, next() drains them
+        """
+        tail = self.end - self.start
+        if tail >= DC.MSG_LEN:
+            return 0
+        if self.start:
+            buf = self.buf
+            for i in range(tail):  # partial frame only, under DC.MSG_LEN bytes
+                buf[i] = buf[self.start + i]
+            self.start = 0
+            self.end = tail
+        read_ct = self.uart.readinto(self.heads[tail])
+        if not read_ct:
+            return 0
+        self.end += read_ct
+        return read_ct
+
+    def next(self):
+        """
+        return next complete frame, None when no complete frame buffered
+        """
+        while self.end - self.start >= DC.MSG_LEN:
+            if self.buf[self.start] == DC.DC_HEADER:
+                if DC.check_crc(self.buf, self.start):
+                    frame = self.msg.load(self.buf, self.start)
+                    self.start += DC.MSG_LEN
+                    if self.resyncing:
+                        self.resyncing = False
+                        self.recovered += 1
+                    return frame
+                self.crc_drops += 1
+            self.start += 1
+            self.discarded += 1
+            self.resyncing = True
+        return None
 
 
 class UARTController(object):
     """
     UART to communicate to upstream / downstream devices. Daisy chain function for usb hub
     """
-    CRC_KEY = '1101'  # polynomial x^3 + x^2 + x^0
     MSG_SCAN = DC.make_data(DC.SCAN, DC.DATA_DEF, DC.DATA_DEF)
+    # commands relayed downstream unless hub no is this hub
+    ADDRESSED = (DC.GET_HUB, DC.SET_HUB, DC.SET_SWITCH, DC.GET_SWITCH, DC.GET_TOT_HUBS)
+    # replies relayed upstream by non-root hubs
+    RETURNS = (DC.GET_HUB_RTN, DC.SET_HUB_RTN, DC.GET_HUBS_RTN, DC.PING_RTN, DC.SET_SWITCH_RTN, DC.GET_SWITCH_RTN,
+               DC.GET_TOT_HUBS_RTN, DC.GET_STATS_RTN)
 
     def __init__(self, tx_upstream: int, rx_upstream: int, tx_downstream: int, rx_downstream: int, baudrate=HW.UART_BAUD):
-        self.q_us = deque((), HW.Q_LEN)
         self.uart_us = UART(0, baudrate=baudrate, tx=Pin(tx_upstream), rx=Pin(rx_upstream))
-        self.q_ds = deque((), HW.Q_LEN)
         self.uart_ds = UART(1, baudrate=baudrate, tx=Pin(tx_downstream), rx=Pin(rx_downstream))
-        self.q_msg = deque((), HW.Q_LEN)
+        self.fr_us = DCFramer(self.uart_us)
+        self.fr_ds = DCFramer(self.uart_ds)
+        self.framers = (self.fr_us, self.fr_ds)
+        self.q_msg = deque((), HW.Q_LEN)  # frames without request id
+        self.pending = {}  # request id: replies received, routed by RSVD byte
+        self.p_lock = _thread.allocate_lock()
+        self.req_id = DC.RSVD
+        self.req_us = array('I', bytes(4 * 256))  # request id: ticks_us sent, ack round trip
+        self.late = 0  # replies to requests no longer pending (timed out)
+        self.mcast = {}  # request id: multicast ack gathering state
+        # commands addressed to this hub, frame ring run by _local_worker on main core
+        self.lq_buf = bytearray(HW.Q_LEN * DC.MSG_LEN)
+        self.lq_func = [None] * HW.Q_LEN
+        self.lq_head = 0
+        self.lq_len = 0
+        self.lq_msg = DCView()
+        self.lq_pending = False  # worker scheduled and not yet started, cleared by _local_worker
+        self._local_cb = self._local_worker  # bound once, schedule() called from relay path
+        self.tx_lock = _thread.allocate_lock()  # both cores transmit
+        self.tx_buf = bytearray(DC.MSG_LEN)  # frames encoded by send_frame, guarded by tx_lock
+        self.baud = baudrate
+        self.baud_deadline = None  # uncommitted baud rate change falls back to default at this tick
+        self.baud_bad = 0  # upstream bytes read since last valid frame while off default rate
         self.rx_flag = True
+        self.rx_wakeups = 0  # receive loop wake ups, idle load indicator
+        self.rx_reads = 0  # uart reads dispatched to msg_switch
+        self.rx_frames = 0
+        self.rx_lat_sum = 0  # sum of data ready to all frames dispatched (relayed) latency in us over rx_lat_n reads
+        self.rx_lat_n = 0
+        self.rx_lat_max = 0
+        self.poller = select.poll()
+        self.poller.register(self.uart_us, select.POLLIN)
+        self.poller.register(self.uart_ds, select.POLLIN)
         self.q_lock = _thread.allocate_lock()
         _thread.start_new_thread(self.rx_thread, ())
  
-    @staticmethod
-    def _get_crc_field(bit_str: str, poly_str: str, init_filter_str='0') -> str:
-        poly_str = poly_str.lstrip('0')
-        initial_pad = (len(poly_str) - 1) * init_filter_str
-        input_pad_arr = list(bit_str + initial_pad)
-        while '1' in input_pad_arr[:len(bit_str)]:
-            cur_shift = input_pad_arr.index('1')
-            for i in range(len(poly_str)):
-                input_pad_arr[cur_shift + i] = str(int(poly_str[i] != input_pad_arr[cur_shift + i]))
-        return ''.join(input_pad_arr)[len(bit_str):]
-    
-    @staticmethod
-    def _check_crc(bit_str: str, poly_str: str, crc_value: str):
-        poly_str = poly_str.lstrip('0')
-        input_pad_arr = list(bit_str + crc_value)
-        while '1' in input_pad_arr[:len(bit_str)]:
-            cur_shift = input_pad_arr.index('1')
-            for i in range(len(poly_str)):
-                input_pad_arr[cur_shift + i] = str(int(poly_str[i] != input_pad_arr[cur_shift + i]))
-        return '1' not in ''.join(input_pad_arr)[len(bit_str):]
-    
     def _read_data(self, ds_us_obj) -> DCMSG:
         """
         read a daisy chain data outside rx thread function
         """
-        if ds_us_obj.any() > 0:
-            data = ds_us_obj.read(HW.DATA_SIZE)
-            if data[0] != DC.DC_HEADER or len(data) != DC.MSG_LEN:
-                return  # invalid ack data return None
-            return DCMSG(data, data[1], data[2], data[3], data[4])
+        framer = self.fr_us if ds_us_obj is self.uart_us else self.fr_ds
+        frame = framer.next()
+        if frame is None and framer.feed():
+            frame = framer.next()
+        if frame:
+            return frame.copy()
         
     def _wait_ds_ack(self):
         """
@@ -319,21 +1350,125 @@ class UARTController(object):
                     return True
         return False
 
-    def send_upstream(self, data: bytes, no_crc=True) -> int:
+    def send_upstream(self, data: bytes) -> int:
         if data[0] != DC.DC_HEADER or len(data) != DC.MSG_LEN:
             raise ValueError('Invalid daisy chain data')
-        return self.uart_us.write(data)
+        self.tx_lock.acquire()
+        sent = self.uart_us.write(data)
+        self.tx_lock.release()
+        _perf.cnt[PerfStats.TX_US] += 1
+        return sent
 
-    def send_downstream(self, data: bytes, no_crc=True) -> int:
+    def send_downstream(self, data: bytes) -> int:
         if data[0] != DC.DC_HEADER or len(data) != DC.MSG_LEN:
             raise ValueError('Invalid daisy chain data')
-        return self.uart_ds.write(data)
+        self.tx_lock.acquire()
+        sent = self.uart_ds.write(data)
+        self.tx_lock.release()
+        _perf.cnt[PerfStats.TX_DS] += 1
+        return sent
     
+    def send_frame(self, uart, cmd: int, hub_no: int, hub_stat: int, rsvd=DC.RSVD) -> int:
+        """
+        encode a frame into the transmit buffer and send it on uart_us / uart_ds, no allocation
+        """
+        self.tx_lock.acquire()
+        sent = uart.write(DC.make_into(self.tx_buf, cmd, hub_no, hub_stat, rsvd))
+        self.tx_lock.release()
+        _perf.cnt[PerfStats.TX_US if uart is self.uart_us else PerfStats.TX_DS] += 1
+        return sent
+
+    def request(self, cmd: int, hub_no: int, hub_stat: int) -> int:
+        """
+        send a request downstream carrying a fresh request id in RSVD byte, replies are kept for wait()
+        return request id
+        """
+        self.p_lock.acquire()
+        self.req_id = self.req_id % 0xFF + 1  # 1 - 255, RSVD 0 stays unsolicited
+        rid = self.req_id
+        self.pending[rid] = []
+        self.req_us[rid] = time.ticks_us()
+        _perf.high(PerfStats.PENDING_HW, len(self.pending))
+        self.p_lock.release()
+        self.send_frame(self.uart_ds, cmd, hub_no, hub_stat, rid)
+        return rid
+
+    def wait(self, rid: int, timeout_ms: int, count=1, window=False) -> list:
+        """
+        wait until count replies of request id received or timeout, then release the request id. window: timeout is a
+        sweep window expected to end, not counted in TIMEOUTS
+        return replies received, fewer than count when lost
+        """
+        start_ms = time.ticks_ms()
+        replies = self.pending[rid]
+        while len(replies) < count and time.ticks_diff(time.ticks_ms(), start_ms) < timeout_ms:
+            pass
+        self.p_lock.acquire()
+        del self.pending[rid]
+        self.p_lock.release()
+        if len(replies) < count and not window:
+            _perf.cnt[PerfStats.TIMEOUTS] += 1
+        return replies
+
+    def _deliver(self, msg: DCMSG) -> None:
+        """
+        route a reply to the waiter of its request id. frames without request id go to q_msg
+        """
+        if msg.hub_stat == DC.ERROR and msg.cmd != DC.GET_STATS_RTN:  # stats values are not status
+            _perf.cnt[PerfStats.ERRORS] += 1
+        self.p_lock.acquire()
+        replies = self.pending.get(msg.rsvd)
+        if replies is not None:
+            replies.append(msg)
+        self.p_lock.release()
+        if replies is not None:
+            _perf.observe(PerfStats.ACK_RTT, time.ticks_diff(time.ticks_us(), self.req_us[msg.rsvd]))
+            return
+        if msg.rsvd == DC.RSVD:
+            if len(self.q_msg) >= HW.Q_LEN:  # oldest frame dropped
+                _perf.cnt[PerfStats.Q_MSG_DROP] += 1
+            self.q_msg.append(msg)
+            _perf.high(PerfStats.Q_MSG_HW, len(self.q_msg))
+        else:
+            if _debug: print(f'DaisyChain: reply to request no longer pending: {msg}')
+            self.late += 1
+            _perf.cnt[PerfStats.LATE] += 1
+
+    def _set_uart_baud(self, baud: int) -> None:
+        """
+        switch both uarts baud rate once pending transmissions left
+        """
+        self.tx_lock.acquire()
+        self.uart_us.flush()
+        self.uart_ds.flush()
+        self.uart_us.init(baudrate=baud)
+        self.uart_ds.init(baudrate=baud)
+        self.baud = baud
+        self.tx_lock.release()
+
+    def _baud_reset(self) -> None:
+        """
+        fall back to HW.UART_BAUD without negotiation: BAUD_RESET sent downstream at current rate first, so every hop
+        still hearing this one follows
+        """
+        if _debug: print(f'DaisyChain: baud rate {self.baud} reset to {HW.UART_BAUD}')
+        self.send_frame(self.uart_ds, DC.SET_BAUD, DC.BAUD_RESET, DC.DATA_DEF)
+        self.baud_deadline = None
+        self.baud_bad = 0
+        self._set_uart_baud(HW.UART_BAUD)
+
     def dc_broadcast(self) -> int:
         """
         Initiate a broadcast daisy chain signal to query for avaiable chain-able hubs. The current hub (issuer) will 
-        be the first device of the chain.
+        be the first device of the chain. Chain falls back to default baud rate first: negotiated, else forced with a
+        BAUD_RESET. Hubs past a broken hop fall back on the SCAN they cannot decode, found by the next discovery
         """
+        if self.baud != HW.UART_BAUD:
+            set_baud(HW.UART_BAUD)
+        if self.baud != HW.UART_BAUD:
+            frame_ms = DC.MSG_LEN * 10 * 1000 // self.baud + 1
+            self._baud_reset()
+            time.sleep_ms(2 * frame_ms + DC.BAUD_RESET_MS)  # first hop relays BAUD_RESET and switches before SCAN
         self.q_lock.acquire()
         global hub_chain_id
         global total_hubs
@@ -352,13 +1487,14 @@ class UARTController(object):
                         hub_chain_id = 0
                         total_hubs = hubs_data.hub_no
                         if _debug: print(f'DaisyChain: received return message. Total hubs are: {total_hubs}. This hub index: {hub_chain_id}')
+                        self._queue_local(UARTController._local_save_topology, hubs_data)  # flash write on main core
                         return total_hubs  # return back with total number of hubs on chain (starting 0)
         total_hubs = -1
         hub_chain_id = -1
-        self.q_lock.release()
+        self.q_lock.release()  # failed scan never persisted, topology cached in flash kept
         return -1
     
-    def msg_relay_broadcast(self, dcmsg: DCMSG) -> int:
+    def msg_relay_broadcast(self, dcmsg: DCView) -> int:
         """
         downstream hubs for relaying or returning daisy chain message
         """
@@ -375,8 +1511,9 @@ class UARTController(object):
             global total_hubs
             total_hubs = hub_chain_id + 1  # no of end chain hub is total hubs number
             if _debug: print(f'DaisyChain: this hub is end of chain, this hub id: {hub_chain_id}, sending back: {dc_rtn_msg}')
+            self._queue_local(UARTController._local_save_topology, dcmsg)
     
-    def msg_return_chain(self, dcmsg: DCMSG) -> None:
+    def msg_return_chain(self, dcmsg: DCView) -> None:
         """
         returning daisy chain downstream 
         """
@@ -384,80 +1521,305 @@ class UARTController(object):
         global total_hubs
         total_hubs = dcmsg.hub_no
         self.send_upstream(dcmsg.raw)
+        self._queue_local(UARTController._local_save_topology, dcmsg)
+
+    def msg_ping(self, dcmsg: DCView) -> None:
+        """
+        topology validation sweep. Hub no carries root cached total hubs, hub stat counts hops, so every hub checks
+        its own cached position on the way. End of chain replies and still relays, any hub past it replies error
+        """
+        if hub_chain_id != dcmsg.hub_stat or total_hubs != dcmsg.hub_no:
+            if _debug: print(f'DaisyChain: PING: position mismatch, this hub: {hub_chain_id}/{total_hubs}: {dcmsg}')
+            self.send_frame(self.uart_us, DC.PING_RTN, dcmsg.hub_stat, DC.ERROR, dcmsg.rsvd)
+            return
+        if hub_chain_id + 1 == total_hubs:
+            self.send_frame(self.uart_us, DC.PING_RTN, hub_chain_id, total_hubs, dcmsg.rsvd)
+        if dcmsg.hub_stat < 0xFF:
+            self.send_frame(self.uart_ds, DC.PING, dcmsg.hub_no, dcmsg.hub_stat + 1, dcmsg.rsvd)
     
-    def msg_switch(self, data: bytes) -> None:
+    def msg_baud(self, dcmsg: DCView) -> None:
+        """
+        baud rate negotiation. Hub no is the phase, hub stat the HW.UART_BAUDS index. PROPOSE travels to end of chain
+        which acks when every hop can switch, COMMIT switches each hop once relayed, CONFIRM sent at new rate is acked
+        by end of chain. Hubs fall back to default rate when no CONFIRM ack passes within DC.BAUD_CONFIRM_TIMEOUT,
+        on RESET, or once DC.BAUD_BAD_BYTES upstream bytes (a default rate SCAN) arrive without a valid frame
         """
-        routing message to its owm execution function
+        eoc_hub = hub_chain_id + 1 >= total_hubs
+        if dcmsg.hub_no == DC.BAUD_PROPOSE:
+            if dcmsg.hub_stat >= len(HW.UART_BAUDS):
+                self.send_frame(self.uart_us, DC.SET_BAUD_RTN, DC.BAUD_PROPOSE, DC.ERROR, dcmsg.rsvd)
+            elif eoc_hub:
+                self.send_frame(self.uart_us, DC.SET_BAUD_RTN, DC.BAUD_PROPOSE, DC.ACK, dcmsg.rsvd)
+            else:
+                self.send_downstream(dcmsg.raw)
+        elif dcmsg.hub_no == DC.BAUD_COMMIT and dcmsg.hub_stat < len(HW.UART_BAUDS):
+            if not eoc_hub:
+                self.send_downstream(dcmsg.raw)
+            self._set_uart_baud(HW.UART_BAUDS[dcmsg.hub_stat])
+            self.baud_deadline = time.ticks_add(time.ticks_ms(), DC.BAUD_CONFIRM_TIMEOUT)
+        elif dcmsg.hub_no == DC.BAUD_CONFIRM:
+            if eoc_hub:
+                self.baud_deadline = None
+                self.send_frame(self.uart_us, DC.SET_BAUD_RTN, DC.BAUD_CONFIRM, DC.ACK, dcmsg.rsvd)
+            else:
+                self.send_downstream(dcmsg.raw)
+        elif dcmsg.hub_no == DC.BAUD_RESET and self.baud != HW.UART_BAUD:
+            self._baud_reset()
+
+    def msg_switch(self, msg: DCView) -> None:
         """
-        if not data:  # prevent checking None
+        routing message to its owm execution function. msg is the framer DCView, copied before kept
+        """
+        if msg is None:
             return
-        if data[0] != DC.DC_HEADER or len(data) != DC.MSG_LEN:
+        cmd = msg.cmd
+        # relay fast path: frames for other hubs and upstream returns pass through before any local work, allocating
+        # nothing
+        if cmd in self.ADDRESSED and msg.hub_no != hub_chain_id:
+            if _debug: print(f"DaisyChain: {cmd}: not in scope of current chain, relaying to next hub")
+            self.send_downstream(msg.raw)
+            _perf.cnt[PerfStats.RELAYED] += 1
             return
-        msg = DCMSG(data, data[1], data[2], data[3], data[4])
-        if msg.cmd == DC.SCAN:
+        if cmd in self.RETURNS and hub_chain_id > 0:
+            if _debug: print(f"DaisyChain: RTN {cmd}: relaying upstream")
+            self.send_upstream(msg.raw)
+            _perf.cnt[PerfStats.RELAYED] += 1
+            return
+        if msg.cmd == DC.SCAN and msg.hub_stat == DC.ACK:  # ack arriving after dc_broadcast gave up waiting
+            self.late += 1
+        elif msg.cmd == DC.SCAN:
             if _debug: print(f'DaisyChain: SCAN: scan downstream message received: {msg}')
             self.msg_relay_broadcast(msg)
+        elif msg.cmd == DC.SCAN_RTN and hub_chain_id <= 0:  # root reads its own in dc_broadcast, stray one dropped
+            self.late += 1
         elif msg.cmd == DC.SCAN_RTN:
             if _debug: print(f'DaisyChain: SCAN_RTN: returning upstream message received: {msg}')
             self.msg_return_chain(msg)
+        elif msg.cmd == DC.PING:
+            self.msg_ping(msg)
+        elif msg.cmd in DC.MCAST_RTN:
+            if _debug: print(f"DaisyChain: multicast: {msg}")
+            self.msg_mcast(msg)
+        elif msg.cmd in DC.MCAST_RTNS and hub_chain_id > 0:
+            self._mcast_part(msg.rsvd, msg.hub_no, msg.hub_stat)
+        elif msg.cmd == DC.SET_BAUD:
+            if _debug: print(f"DaisyChain: SET_BAUD: {msg}")
+            self.msg_baud(msg)
+        elif msg.cmd == DC.SET_BAUD_RTN and hub_chain_id > 0:
+            if msg.hub_no == DC.BAUD_CONFIRM and msg.hub_stat == DC.ACK:  # whole chain downstream runs new rate
+                self.baud_deadline = None
+            self.send_upstream(msg.raw)
+        elif msg.cmd == DC.GET_HUBS:
+            if _debug: print(f"DaisyChain: GET_HUBS: sweep received: {msg}")
+            if hub_chain_id + 1 < total_hubs:  # keep the sweep travelling before answering
+                self.send_downstream(msg.raw)
+            self._queue_local(UARTController._local_get_hub, msg)
         elif msg.cmd == DC.GET_HUB:
             if _debug: print(f"DaisyChain: GET_HUB: request received: {msg}")
-            if msg.hub_no == hub_chain_id:
-                try:
-                    if hub_chain_id + 1 == total_hubs:
-                        stat = get_hub()
-                    else:  # excluding the channel used for daisy chain next hub
-                        stat = [x for i, x in enumerate(get_hub()) if i != DC.DC_CH]
-                    self.send_upstream(DC.make_data(DC.GET_HUB_RTN, hub_chain_id, int("".join(str(int(i)) for i in reversed(stat)), 2)))
-                except OSError:
-                    if _debug: print("DaisyChain: GET_HUB: calling get_hub error. Possibly hub not activated yet")
-                    self.send_upstream(DC.make_data(DC.GET_HUB_RTN, hub_chain_id, DC.ERROR))
-            else:
-                if _debug: print(f"DaisyChain: GET_HUB: {msg} not in scope of current chain, relaying msg to next hub")
-                self.send_downstream(msg.raw)
+            self._queue_local(UARTController._local_get_hub, msg)
         elif msg.cmd == DC.SET_HUB:
             if _debug: print(f"DaisyChain: SET_HUB: request received: {msg}")
-            if msg.hub_no == hub_chain_id:
-                if hub_chain_id + 1 == total_hubs:
-                    set_lst = [bool(msg.hub_stat & DC.CHANNEL_MSK_1), bool(msg.hub_stat & DC.CHANNEL_MSK_2),
-                               bool(msg.hub_stat & DC.CHANNEL_MSK_3), bool(msg.hub_stat & DC.CHANNEL_MSK_4)]
-                    set_hub(set_lst)
-                    self.send_upstream(DC.make_data(DC.SET_HUB_RTN, hub_chain_id, DC.ACK))
-                else:
-                    set_lst = [bool(msg.hub_stat & DC.CHANNEL_MSK_1), bool(msg.hub_stat & DC.CHANNEL_MSK_2),
-                               bool(msg.hub_stat & DC.CHANNEL_MSK_3)]
-                    set_lst.insert(DC.DC_CH, True)  # channel to chain next hub should always set on
-                    set_hub(set_lst)
-                    self.send_upstream(DC.make_data(DC.SET_HUB_RTN, hub_chain_id, DC.ACK))
-            else:
-                if _debug: print(f"DaisyChain: SET_HUB: {msg} not in scope of current chain, relaying cmd to next hub")
+            self._queue_local(UARTController._local_set_hub, msg)
+        elif msg.cmd == DC.SET_SWITCH:
+            if _debug: print(f"DaisyChain: SET_SWITCH: request received: {msg}")
+            self._queue_local(UARTController._local_set_switch, msg)
+        elif msg.cmd == DC.GET_SWITCH:  # pin reads only, answered on this core
+            self.send_frame(self.uart_us, DC.GET_SWITCH_RTN, hub_chain_id, _encode_switch_stat(), msg.rsvd)
+        elif msg.cmd == DC.GET_TOT_HUBS:
+            self.send_frame(self.uart_us, DC.GET_TOT_HUBS_RTN, hub_chain_id, total_hubs & 0xFF, msg.rsvd)
+        elif msg.cmd == DC.GET_STATS:  # counter reads only, answered on this core
+            if hub_chain_id + 1 < total_hubs:  # sweep travels on before answering
                 self.send_downstream(msg.raw)
-        elif msg.cmd in [DC.GET_HUB_RTN, DC.SET_HUB_RTN] and hub_chain_id > 0:
-            if _debug: print(f"DaisyChain: GET/SET_HUB_RTN: {msg}")
-            self.send_upstream(msg.raw)
-        else:  # all the rest dump into msg queue, mainly for controlling hub to read
-            self.q_msg.append(msg)
+            stat = DC.minifloat(_perf.field(msg.hub_stat, self.framers)) if msg.hub_stat < len(PerfStats.FIELDS) \
+                else DC.ERROR
+            self.send_frame(self.uart_us, DC.GET_STATS_RTN, hub_chain_id, stat, msg.rsvd)
+        else:  # all the rest routed to its request waiter or msg queue, mainly for controlling hub to read
+            self._deliver(msg.copy())  # replies kept past the framer buffer
+
+    def _queue_local(self, func, msg: DCView) -> None:
+        """
+        hand a command addressed to this hub to the main core (micropython.schedule), so relaying on this core never
+        waits on hub work such as a reset. Frame copied out of framer buffer into the local ring, oldest dropped when
+        full. func is the plain UARTController function (a bound method would allocate per frame)
+        """
+        self.p_lock.acquire()
+        if self.lq_len >= HW.Q_LEN:
+            _perf.cnt[PerfStats.Q_LOCAL_DROP] += 1
+            self.lq_head = (self.lq_head + 1) % HW.Q_LEN
+            self.lq_len -= 1
+        slot = (self.lq_head + self.lq_len) % HW.Q_LEN
+        base = slot * DC.MSG_LEN
+        raw = msg.raw
+        for i in range(DC.MSG_LEN):
+            self.lq_buf[base + i] = raw[i]
+        self.lq_func[slot] = func
+        self.lq_len += 1
+        _perf.high(PerfStats.Q_LOCAL_HW, self.lq_len)
+        self.p_lock.release()
+        self._schedule_local()
+
+    def _schedule_local(self) -> None:
+        """
+        schedule _local_worker unless pending already. A full schedule queue (VBus timer, button, boot timers) is
+        retried from the rx_thread idle pass while frames wait in the ring
+        """
+        if self.lq_pending:
+            return
+        self.lq_pending = True  # set first, worker may start on main core before schedule() returns
+        try:
+            micropython.schedule(self._local_cb, None)
+        except RuntimeError:
+            self.lq_pending = False
+            _perf.cnt[PerfStats.SCHED_FULL] += 1
+
+    def _local_worker(self, _) -> None:
+        """
+        run queued local commands on main core, each acking upstream when finished
+        """
+        self.lq_pending = False  # frames queued from here on schedule another run
+        msg = self.lq_msg
+        while self.lq_len > 0:
+            self.p_lock.acquire()
+            slot = self.lq_head
+            func = self.lq_func[slot]
+            self.lq_func[slot] = None
+            msg.load(self.lq_buf, slot * DC.MSG_LEN)
+            self.lq_head = (slot + 1) % HW.Q_LEN
+            self.lq_len -= 1
+            self.p_lock.release()
+            func(self, msg)
+
+    def _local_save_topology(self, msg: DCView) -> None:
+        _save_topology()  # flash write on main core
+
+    def _local_get_hub(self, msg: DCView) -> None:
+        rtn = DC.GET_HUBS_RTN if msg.cmd == DC.GET_HUBS else DC.GET_HUB_RTN
+        self.send_frame(self.uart_us, rtn, hub_chain_id, _encode_chain_stat(), msg.rsvd)
+
+    def _local_set_hub(self, msg: DCView) -> None:
+        try:
+            set_hub_mask(_chain_set_mask(msg.hub_stat))
+            stat = DC.ACK
+        except OSError:
+            if _debug: print("DaisyChain: SET_HUB: calling set_hub error")
+            stat = DC.ERROR
+        self.send_frame(self.uart_us, DC.SET_HUB_RTN, hub_chain_id, stat, msg.rsvd)
+
+    def _local_set_switch(self, msg: DCView) -> None:
+        try:
+            set_switch(msg.hub_stat, 'chain')
+            stat = DC.ACK
+        except ValueError:
+            if _debug: print(f"DaisyChain: SET_SWITCH: invalid channel: {msg.hub_stat}")
+            stat = DC.ERROR
+        self.send_frame(self.uart_us, DC.SET_SWITCH_RTN, hub_chain_id, stat, msg.rsvd)
+
+    def msg_mcast(self, dcmsg: DCView) -> None:
+        """
+        multicast command, hub no is group bitmask. Relayed downstream first, applied locally when this hub is in a
+        group, then acks of this hub and all downstream hubs go upstream as one RTN (hub no: applied, hub stat: failed)
+        """
+        member = hub_groups & dcmsg.hub_no
+        eoc_hub = hub_chain_id + 1 >= total_hubs
+        self.p_lock.acquire()  # cmd, parts outstanding (local apply, downstream RTN), applied, failed
+        self.mcast[dcmsg.rsvd] = [dcmsg.cmd, int(bool(member)) + int(not eoc_hub), 0, 0]
+        self.p_lock.release()
+        if not eoc_hub:
+            self.send_downstream(dcmsg.raw)
+        if member:
+            self._queue_local(UARTController._local_mcast, dcmsg)
+        elif eoc_hub:
+            self._mcast_part(dcmsg.rsvd, 0, 0, 0)
+
+    def _mcast_part(self, rid: int, applied: int, failed: int, part=1) -> None:
+        """
+        add a finished part of a multicast, gathered RTN sent upstream once no part outstanding
+        """
+        self.p_lock.acquire()
+        state = self.mcast.get(rid)
+        if state is not None:
+            state[1] -= part
+            state[2] += applied
+            state[3] += failed
+            if state[1] > 0:
+                state = None
+            else:
+                del self.mcast[rid]
+        self.p_lock.release()
+        if state is not None:
+            self.send_frame(self.uart_us, DC.MCAST_RTN[state[0]], min(state[2], 0xFF), min(state[3], 0xFF), rid)
+
+    def _local_mcast(self, msg: DCView) -> None:
+        try:
+            if msg.cmd == DC.SET_HUB_MCAST:
+                set_hub_mask(_chain_set_mask(msg.hub_stat))
+            else:
+                set_switch(msg.hub_stat, 'mcast')
+            self._mcast_part(msg.rsvd, 1, 0)
+        except (OSError, ValueError):
+            if _debug: print(f"DaisyChain: multicast {msg} failed on this hub")
+            self._mcast_part(msg.rsvd, 0, 1)
+
+    def rx_stats(self) -> dict:
+        """
+        receive engine counters. wake ups vs reads shows idle load, latency is uart data ready to msg_switch done
+        """
+        return {'wakeups': self.rx_wakeups, 'reads': self.rx_reads, 'frames': self.rx_frames, 'late': self.late,
+                'crc_drops': self.fr_us.crc_drops + self.fr_ds.crc_drops,
+                'discarded': self.fr_us.discarded + self.fr_ds.discarded,
+                'recovered': self.fr_us.recovered + self.fr_ds.recovered,
+                'lat_avg_us': self.rx_lat_sum // self.rx_lat_n if self.rx_lat_n else 0, 'lat_max_us': self.rx_lat_max}
 
     def rx_thread(self):
+        """
+        event driven receive loop. Sleeps in poll until either uart has data, bounded by HW.RX_POLL_MS so the loop
+        never blocks forever on an idle chain. Every complete frame of a read is dispatched to msg_switch. Relaying
+        allocates nothing; garbage is collected when a poll passes idle and heap runs low.
+        """
         while self.rx_flag:
-            if self.uart_us.any() > 0:  # if there's any data in rx buffer
-                self.q_lock.acquire()
-                self.q_us.append(self.uart_us.read(HW.DATA_SIZE))
-                self.q_lock.release()
-            if self.uart_ds.any() > 0:
-                self.q_lock.acquire()
-                self.q_ds.append(self.uart_ds.read(HW.DATA_SIZE))
-                self.q_lock.release()
-            if len(self.q_us) > 0:  # processing message from upstream
-                self.q_lock.acquire()
-                data_raw = self.q_us.popleft()
-                self.q_lock.release()
-                self.msg_switch(data_raw)
-            if len(self.q_ds) > 0:  # processing message from downstream
-                self.q_lock.acquire()
-                data_raw = self.q_ds.popleft()
-                self.q_lock.release()
-                self.msg_switch(data_raw)
+            self.rx_wakeups += 1
+            reads = self.rx_reads
+            for obj, _ in self.poller.ipoll(HW.RX_POLL_MS):
+                free = gc.mem_free() if _perf.alloc_check else 0
+                framer = self.fr_us if obj is self.uart_us else self.fr_ds
+                frames = self.rx_frames
+                self.q_lock.acquire()  # dc_broadcast owns the uarts while scanning
+                start_us = time.ticks_us()  # relay latency, a scan holding q_lock not counted
+                try:
+                    read_ct = framer.feed()
+                    frame = framer.next()
+                    while frame:
+                        self.rx_frames += 1
+                        _perf.cnt[PerfStats.RX_US if obj is self.uart_us else PerfStats.RX_DS] += 1
+                        self.msg_switch(frame)
+                        frame = framer.next()
+                finally:
+                    self.q_lock.release()
+                if obj is self.uart_us and self.baud != HW.UART_BAUD:
+                    self.baud_bad = 0 if frames != self.rx_frames else self.baud_bad + read_ct
+                    if self.baud_bad >= DC.BAUD_BAD_BYTES:  # upstream talks another rate, root reset the chain
+                        self._baud_reset()
+                lat_us = time.ticks_diff(time.ticks_us(), start_us)
+                self.rx_reads += 1
+                self.rx_lat_sum += lat_us
+                self.rx_lat_n += 1
+                if self.rx_lat_sum > 1 << 28:  # halved before leaving small int range, average kept
+                    self.rx_lat_sum >>= 1
+                    self.rx_lat_n >>= 1
+                _perf.observe(PerfStats.RELAY, lat_us)
+                if lat_us > self.rx_lat_max:
+                    self.rx_lat_max = lat_us
+                if free and gc.mem_free() < free:
+                    _perf.cnt[PerfStats.ALLOC_READS] += 1
+            if reads == self.rx_reads and _perf.mem(gc.mem_free()) < HW.GC_LOW_WATER:
+                gc_collect()
+            if self.lq_len and not self.lq_pending:  # schedule queue was full when frames were queued
+                self._schedule_local()
+            if _restore_due >= 0:
+                _restore_poll()
+            if self.baud_deadline is not None and time.ticks_diff(time.ticks_ms(), self.baud_deadline) > 0:
+                if _debug: print(f'DaisyChain: baud rate {self.baud} not confirmed, falling back to {HW.UART_BAUD}')
+                self._baud_reset()
 
 
 def version() -> str:
@@ -475,9 +1837,13 @@ __doc__ = f'''Functions:
          '''
 
 
+# boot stage 1: pins to a defined state and chain relaying. Hub config and VBus sampling deferred to _boot_hw
+_perf = PerfStats()
 _led_ind = Pin(HW.IND_LED, Pin.OUT)
 _adc_a1 = ADC(HW.ADC_1_1)
 _adc_a2 = ADC(HW.ADC_1_2)
+_adcs = (_adc_a1, _adc_a2)
+_vbus = VBUSMonitor(_adcs)
 # switch ICs pin power up pre-condition
 _sw2_pd = Pin(HW.PD_U2, Pin.OUT)
 _sw2_pd.value(HW.LOW)
@@ -492,6 +1858,12 @@ _sw_man.irq(trigger=Pin.IRQ_FALLING, handler=_intr_change_switch)
 # HUB IC pin pre-condition
 _hub_rst = Pin(HW.HUB_RST, Pin.OUT)
 _hub_rst.value(HW.LOW)
+_hub = HUBI2C()
+_boot('pins')
+# Daisy chain position from flash before relaying starts, relay fast path routes by it
+_load_topology()
+_boot('topology')
 # Daisy chain UART set up
 _uart = UARTController(HW.UART_U_TX, HW.UART_U_RX, HW.UART_D_TX, HW.UART_D_RX)
-_hub = HUBI2C()
+_boot('uart')
+_boot_tmr = Timer(mode=Timer.ONE_SHOT, period=HW.BOOT_DEFER_MS, callback=_boot_hw)
@@ -0,0 +1,36 @@
+"""
+On-board RPC dispatcher for host raw REPL transport (commsrepl.rawrepl). Copy to the board alongside main.py / conf.py.
+Results go back length framed: 0x02 | R (result) or E (exception) | 8 hex digits payload length | payload
+where result payload is repr() of return value and exception payload is 'Type: message'
+"""
+import sys
+import __main__
+
+FUNCS = ('set_hub', 'get_hub', 'set_hub_chain', 'set_hubs', 'get_hubs', 'get_hub_chain', 'set_switch', 'get_switch',
+         'set_switch_chain', 'get_switches', 'get_switch_chain', 'set_hub_group', 'set_switch_group', 'set_groups',
+         'get_adc', 'vbus_stats', 'switch_log', 'switch_latency', 'discovery_chain', 'restore_chain', 'set_baud',
+         'stats', 'get_stats_chain', 'boot_log', 'ind_led', 'flip_indicator_led', 'version')
+
+
+def _frame(status: str, payload: str) -> None:
+    sys.stdout.write('\x02{}{:08x}'.format(status, len(payload.encode())))
+    sys.stdout.write(payload)
+
+
+def reply(result) -> None:
+    _frame('R', repr(result))
+
+
+def call(name: str, *args) -> None:
+    """
+    call main.py function by name with args, reply its result or exception
+    """
+    if name not in FUNCS:
+        _frame('E', 'ValueError: {} not callable over rpc'.format(name))
+        return
+    try:
+        result = getattr(__main__, name)(*args)
+    except Exception as e:
+        _frame('E', '{}: {}'.format(type(e).__name__, e))
+        return
+    reply(result)
@@ -0,0 +1,11 @@
+"""
+Host simulator of usb-xwitch boards. Runs unmodified pico/main.py per hub on CPython with the MicroPython `machine`
+layer simulated, so daisy chains larger than can be built physically are tested and profiled on one host.
+    >>> from sim import Chain
+    >>> with Chain(32) as chain:
+    ...     chain.root.discovery_chain()
+    32
+"""
+from .chain import Chain, Hub
+from .hw import Board
+from .usb2514b import USB2514B
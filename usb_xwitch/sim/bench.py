@@ -0,0 +1,162 @@
+"""
+Chain benchmarks on the simulator: latency percentiles and throughput of root entry points against chain depth.
+    python -m sim.bench --depths 1,8,32,64 --bauds 9600,115200 --out bench.json
+Results saved as JSON (one record per depth, baud and entry point) so runs of firmware versions can be compared.
+"""
+import argparse
+import json
+import platform
+import time
+from .chain import Chain
+
+DEPTHS = (1, 2, 4, 8, 16, 32, 64)
+BAUDS = (9600, 115200)
+ROUNDS = 20
+DISCOVERY_ROUNDS = 3  # every discovery waits END_CHAIN_TIMEOUT at end of chain
+PATTERNS = ([True, False, True], [False, True, False])  # alternated so every SET_HUB reconfigures the hub
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(sorted_vals: list, pct: float) -> float:
+    """
+    nearest rank percentile of sorted values
+    """
+    if not sorted_vals:
+        return None
+    rank = max(0, min(len(sorted_vals) - 1, int(round(pct / 100 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[rank]
+
+
+def summarise(lat_s: list, failed: int, frames: int) -> dict:
+    vals = sorted(s * 1000 for s in lat_s)
+    res = {'n': len(vals), 'failed': failed, 'frames_per_op': frames / max(1, len(vals) + failed)}
+    res.update({f'p{p}_ms': percentile(vals, p) for p in PERCENTILES})
+    res['max_ms'] = vals[-1] if vals else None
+    res['mean_ms'] = sum(vals) / len(vals) if vals else None
+    res['ops_per_s'] = len(vals) / (sum(vals) / 1000) if vals and sum(vals) else None
+    return res
+
+
+def _frames(chain: Chain) -> int:
+    return sum(hub.main._uart.rx_frames for hub in chain.hubs)
+
+
+def _run(chain: Chain, func, rounds: int) -> dict:
+    """
+    time func(round) rounds times. func returning False or raising counts as failed
+    """
+    lat_s = []
+    failed = 0
+    frames = _frames(chain)
+    for i in range(rounds):
+        start = time.perf_counter()
+        try:
+            ok = func(i) is not False
+        except (ValueError, OSError, IndexError):
+            ok = False
+        if ok:
+            lat_s.append(time.perf_counter() - start)
+        else:
+            failed += 1
+    return summarise(lat_s, failed, _frames(chain) - frames)
+
+
+def _set_last(root, depth: int):
+    def run(i):
+        last = PATTERNS[i % 2] + [i % 2 == 0] if depth > 1 else list(PATTERNS[i % 2])  # root takes 3 channels
+        return root.set_hub_chain(*([None] * (depth - 1) + [last]))
+    return run
+
+
+def _set_all_pipelined(root, depth: int):
+    def run(i):
+        args = [list(PATTERNS[i % 2]) for _ in range(depth - 1)] + [PATTERNS[i % 2] + [True]]
+        return not root.set_hub_chain(*args, pipelined=True)
+    return run
+
+
+def crc_cost(conf, rounds=2000) -> dict:
+    """
+    host CPU cost of DC.crc per frame. Relative figure only, multiply by frames_per_op for a per operation share
+    """
+    frames = [conf.DC.make_data(conf.DC.SET_HUB, i & 0xFF, i & 0x0F, i & 0xFF) for i in range(rounds)]
+    start = time.perf_counter()
+    for frame in frames:
+        conf.DC.crc(frame)
+    return {'us_per_frame': (time.perf_counter() - start) * 1e6 / rounds}
+
+
+def bench_depth(depth: int, baud: int, rounds=ROUNDS, discovery_rounds=DISCOVERY_ROUNDS, overrides=None) -> dict:
+    """
+    benchmark all entry points on one chain of depth hubs at baud
+    """
+    conf_overrides = {'HW.UART_BAUD': baud}
+    conf_overrides.update(overrides or {})
+    with Chain(depth, conf_overrides) as chain:
+        root = chain.root
+        expect = depth if depth > 1 else -1  # single board concludes standalone
+        res = {'discovery_chain': _run(chain, lambda i: root.discovery_chain() == expect, discovery_rounds)}
+        if root.total_hubs != expect:
+            root.discovery_chain()
+        res['set_hub'] = _run(chain, lambda i: root.set_hub(PATTERNS[i % 2] + [True]), rounds)
+        if depth == 1:  # chain entry points need a chain
+            res['crc'] = crc_cost(chain.conf)
+            res['errors'] = [f'hub {i}: {e!r}' for i, e in chain.errors()]
+            res['version'] = root.__version__
+            return res
+        res['get_hubs'] = _run(chain, lambda i: len(root.get_hubs()) == depth, rounds)
+        res['set_hub_chain'] = _run(chain, _set_last(root, depth), rounds)
+        res['set_hub_chain_pipelined'] = _run(chain, _set_all_pipelined(root, depth), rounds)
+        res['crc'] = crc_cost(chain.conf)
+        res['crc']['frames_per_get_hubs'] = res['get_hubs']['frames_per_op']
+        res['errors'] = [f'hub {i}: {e!r}' for i, e in chain.errors()]
+        res['version'] = root.__version__
+    return res
+
+
+def run(depths=DEPTHS, bauds=BAUDS, rounds=ROUNDS, discovery_rounds=DISCOVERY_ROUNDS, overrides=None,
+        verbose=True) -> dict:
+    report = {'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                       'host': platform.node(), 'rounds': rounds, 'overrides': overrides or {}},
+              'results': []}
+    for baud in bauds:
+        for depth in depths:
+            res = bench_depth(depth, baud, rounds, discovery_rounds, overrides)
+            report['meta']['version'] = res.pop('version')
+            errors = res.pop('errors')
+            for entry, stats in res.items():
+                report['results'].append(dict(stats, depth=depth, baud=baud, entry=entry))
+            if errors:
+                report['results'].append({'depth': depth, 'baud': baud, 'entry': 'errors', 'errors': errors})
+            if verbose:
+                print(f"baud {baud} depth {depth}: " + ', '.join(
+                    f"{entry} p50 {stats['p50_ms']:.1f}ms p99 {stats['p99_ms']:.1f}ms"
+                    for entry, stats in res.items() if stats.get('p50_ms') is not None))
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m sim.bench', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--depths', default=','.join(map(str, DEPTHS)), help='comma separated chain depths')
+    parser.add_argument('--bauds', default=','.join(map(str, BAUDS)), help='comma separated uart baud rates')
+    parser.add_argument('--rounds', type=int, default=ROUNDS)
+    parser.add_argument('--discovery-rounds', type=int, default=DISCOVERY_ROUNDS)
+    parser.add_argument('--end-chain-timeout', type=int, help='DC.END_CHAIN_TIMEOUT override in ms')
+    parser.add_argument('--broadcast-timeout', type=int, help='DC.BROADCAST_TIMEOUT override in ms')
+    parser.add_argument('--out', default='bench.json', help='JSON results file')
+    args = parser.parse_args(argv)
+    overrides = {}
+    if args.end_chain_timeout is not None:
+        overrides['DC.END_CHAIN_TIMEOUT'] = args.end_chain_timeout
+    if args.broadcast_timeout is not None:
+        overrides['DC.BROADCAST_TIMEOUT'] = args.broadcast_timeout
+    report = run([int(d) for d in args.depths.split(',')], [int(b) for b in args.bauds.split(',')], args.rounds,
+                 args.discovery_rounds, overrides)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f'results saved: {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
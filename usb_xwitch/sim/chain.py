@@ -0,0 +1,180 @@
+"""
+Virtual daisy chain: N boards wired UART to UART, each running its own instance of pico/main.py with simulated
+hardware modules injected in place of the MicroPython ones
+"""
+import builtins
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+from . import mpy
+from .hw import Board, link
+
+PICO_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pico')
+SWITCH_INTERVAL = 0.0002  # interpreter thread switch interval, busy waits in firmware otherwise starve relaying hubs
+RX_STOP_TIMEOUT = 1.0
+BOOT_TIMEOUT = 5.0  # deferred hardware init of every hub done within
+
+
+def _exec(name: str, path: str, code, modules: dict, opener=None) -> types.ModuleType:
+    """
+    execute firmware source as a fresh module, imports of names in modules resolved to them
+    """
+    def _import(mod_name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 and mod_name in modules:
+            return modules[mod_name]
+        return builtins.__import__(mod_name, globals, locals, fromlist, level)
+
+    mod = types.ModuleType(name)
+    mod.__file__ = path
+    mod_builtins = dict(builtins.__dict__)
+    mod_builtins['__import__'] = _import
+    if opener is not None:
+        mod_builtins['open'] = opener
+    mod.__dict__['__builtins__'] = mod_builtins
+    exec(code, mod.__dict__)
+    return mod
+
+
+class Hub(object):
+    """
+    one simulated board and its main.py instance (attribute main, None until booted)
+    """
+    def __init__(self, index: int, conf: types.ModuleType, fs_dir: str, timers=False) -> None:
+        self.index = index
+        self.conf = conf
+        self.board = Board(f'hub{index}', conf.HUBAddr.POR_IMAGE, conf.HW.HUB_RST, timers)
+        self.sched = mpy.Scheduler(self.board.name)
+        self.fs_dir = os.path.join(fs_dir, self.board.name)
+        os.makedirs(self.fs_dir, exist_ok=True)
+        self.main = None
+        self.set_vbus(1, 5.0)
+        self.set_vbus(2, 5.0)
+
+    def open(self, file, mode='r', *args, **kwargs):
+        """
+        board flash file system, one directory per board
+        """
+        return builtins.open(os.path.join(self.fs_dir, file), mode, *args, **kwargs)
+
+    def modules(self, conf: types.ModuleType) -> dict:
+        return {'machine': self.board.machine(), 'micropython': mpy.micropython(self.sched), 'time': mpy.time,
+                'utime': mpy.time, '_thread': mpy._thread, 'select': mpy.select, 'uselect': mpy.select,
+                'gc': mpy.gc, 'ucollections': mpy.ucollections, 'conf': conf}
+
+    def boot(self, code) -> types.ModuleType:
+        self.main = _exec('main', os.path.join(PICO_DIR, 'main.py'), code, self.modules(self.conf), self.open)
+        return self.main
+
+    def wait_ready(self, timeout=BOOT_TIMEOUT) -> bool:
+        """
+        wait for deferred boot stage (hub config, VBus monitor) of main.py to finish
+        """
+        deadline = time.monotonic() + timeout
+        while self.main._hw_state != 2:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def set_vbus(self, ch: int, volts) -> None:
+        """
+        VBus voltage of switch channel 1 / 2 as float, or callable(monotonic time) -> float for scripted waveforms
+        """
+        pin = (self.conf.HW.ADC_1_1, self.conf.HW.ADC_1_2)[ch - 1]
+        ratio = self.conf.HW.ADC_RATIO
+        self.board.adc_v[pin] = (lambda t: volts(t) * ratio) if callable(volts) else volts * ratio
+
+    def press_switch(self, hold_s=0.05) -> None:
+        self.board.press(self.conf.HW.SW_MAN, hold_s)
+
+    def ports(self):
+        """
+        downstream ports enabled as the USB2514B model runs them, None when hub not attached
+        """
+        return self.board.hub.ports_enabled()
+
+    def stop(self) -> None:
+        if self.main is not None:
+            self.main._uart.rx_flag = False
+        for timer in self.board.timer_objs:
+            timer.deinit()
+        self.sched.stop()
+
+
+class Chain(object):
+    """
+    N hub virtual daisy chain. hub 0 is the root, its main.py module is chain.root
+    e.g.:
+        >>> with Chain(8) as chain:
+        ...     chain.root.discovery_chain()
+        ...     chain.root.set_hub_chain(None, [1, 0, 0])
+        ...     chain.hubs[1].ports()
+        8
+        [True, False, False, True]
+    :param overrides: conf attributes set before boot, e.g. {'HW.UART_BAUD': 115200, 'DC.END_CHAIN_TIMEOUT': 200}
+    :param timers: run periodic machine.Timer callbacks (VBus monitor sampling), off by default to keep large chains
+        light. One shot timers (deferred boot stage) always run
+    """
+    def __init__(self, n: int, overrides=None, timers=False, boot=True, fs_dir=None) -> None:
+        self.n = n
+        self._fs_tmp = fs_dir is None
+        self.fs_dir = tempfile.mkdtemp(prefix='xwitch-sim-') if fs_dir is None else fs_dir
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(SWITCH_INTERVAL)
+        self.conf = self._load_conf(overrides or {})
+        self.hubs = [Hub(i, self.conf, self.fs_dir, timers) for i in range(n)]
+        for up, down in zip(self.hubs, self.hubs[1:]):
+            link(up.board, down.board)
+        if boot:
+            self.boot()
+
+    def _load_conf(self, overrides: dict) -> types.ModuleType:
+        path = os.path.join(PICO_DIR, 'conf.py')
+        with open(path) as f:
+            code = compile(f.read(), path, 'exec')
+        conf = _exec('conf', path, code, {'ucollections': mpy.ucollections})
+        for key, value in overrides.items():
+            cls, attr = key.split('.')
+            setattr(getattr(conf, cls), attr, value)
+        return conf
+
+    def boot(self) -> None:
+        """
+        run main.py on every board, end of chain first so downstream ports listen before upstream boots. Returns once
+        deferred boot stages finished on every board
+        """
+        path = os.path.join(PICO_DIR, 'main.py')
+        with open(path) as f:
+            code = compile(f.read(), path, 'exec')
+        for hub in reversed(self.hubs):
+            hub.boot(code)
+        for hub in self.hubs:
+            if not hub.wait_ready():
+                raise TimeoutError(f'{hub.board.name}: boot not finished within {BOOT_TIMEOUT}s')
+
+    @property
+    def root(self) -> types.ModuleType:
+        return self.hubs[0].main
+
+    def errors(self) -> list:
+        """
+        exceptions raised in scheduled callbacks on any board, as (hub index, exception)
+        """
+        return [(hub.index, e) for hub in self.hubs for e in hub.sched.errors]
+
+    def close(self) -> None:
+        for hub in self.hubs:
+            hub.stop()
+        time.sleep(min(RX_STOP_TIMEOUT, self.conf.HW.RX_POLL_MS * 2 / 1000))  # rx threads leave their poll
+        sys.setswitchinterval(self._switch_interval)
+        if self._fs_tmp:
+            shutil.rmtree(self.fs_dir, ignore_errors=True)
+
+    def __enter__(self) -> 'Chain':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,327 @@
+"""
+RP2040 `machine` stand-in for one simulated board: GPIO pins with IRQs, scriptable ADC voltages, UARTs over timed byte
+links, I2C to a USB2514B model, Timer, SIO mem32 registers
+"""
+import collections
+import threading
+import time
+import types
+from .usb2514b import USB2514B
+
+GPIO_COUNT = 30
+UART_BITS = 10  # start + 8 data + stop bits per byte
+ADC_PINS = (26, 27, 28, 29)
+SIO_GPIO_IN = 0xd0000004
+SIO_GPIO_OUT = 0xd0000010
+SIO_GPIO_OUT_SET = 0xd0000014
+SIO_GPIO_OUT_CLR = 0xd0000018
+SIO_GPIO_OUT_XOR = 0xd000001c
+
+
+class Link(object):
+    """
+    one direction of a UART wire. Bytes arrive UART_BITS / baud apart after the transmitter is free, and arrive
+    corrupted when transmitter and receiver baud rates differ
+    """
+    def __init__(self, board=None) -> None:
+        self.q = collections.deque()  # (arrival monotonic time, byte, baud transmitted at)
+        self.lock = threading.Lock()
+        self.busy_until = 0.0
+        self.board = board  # receiving board, None when wire unconnected
+        self.sent = 0
+
+    def send(self, data: bytes, baud: int) -> None:
+        if self.board is None:
+            return
+        byte_s = UART_BITS / baud
+        with self.lock:
+            t = max(time.monotonic(), self.busy_until)
+            for b in data:
+                t += byte_s
+                self.q.append((t, b, baud))
+            self.busy_until = t
+            self.sent += len(data)
+        with self.board.rx_cond:
+            self.board.rx_cond.notify_all()
+
+    def recv(self, n: int, baud: int) -> bytes:
+        now = time.monotonic()
+        out = bytearray()
+        with self.lock:
+            while self.q and len(out) < n and self.q[0][0] <= now:
+                _, b, tx_baud = self.q.popleft()
+                out.append(b if tx_baud == baud else ~b & 0xFF)
+        return bytes(out)
+
+    def available(self) -> int:
+        now = time.monotonic()
+        with self.lock:
+            return sum(1 for t, _, _ in self.q if t <= now)
+
+    def next_arrival(self):
+        with self.lock:
+            return self.q[0][0] if self.q else None
+
+
+class Board(object):
+    """
+    hardware state of one board. machine() builds the module main.py imports
+    """
+    def __init__(self, name: str, por_image: bytes, rst_pin: int, timers=False) -> None:
+        self.name = name
+        self.levels = [0] * GPIO_COUNT
+        self.modes = [None] * GPIO_COUNT
+        self.irqs = {}  # pin: (trigger, handler, pin object)
+        self.pin_cb = {}  # pin: callable(level) hardware wired to a pin
+        self.adc_v = {pin: 0.0 for pin in ADC_PINS}  # volts at adc pin, float or callable(monotonic time)
+        self.rx_cond = threading.Condition()
+        self.tx = [Link(), Link()]  # UART id: link transmitted on, unconnected until link()
+        self.rx = [Link(self), Link(self)]  # UART id: link received from
+        self.uarts = {}
+        self.hub = USB2514B(por_image)
+        self.pin_cb[rst_pin] = lambda level: self.hub.reset(bool(level))
+        self.timers = timers  # periodic Timer callbacks run only when enabled, one shot always
+        self.timer_objs = []
+        self.lock = threading.RLock()  # stands in for disable_irq
+
+    def set_level(self, pin: int, level: int) -> None:
+        prev = self.levels[pin]
+        self.levels[pin] = level
+        cb = self.pin_cb.get(pin)
+        if cb is not None:
+            cb(level)
+        irq = self.irqs.get(pin)
+        if irq is not None and prev != level:
+            trigger, handler, obj = irq
+            if trigger & (Pin.IRQ_RISING if level else Pin.IRQ_FALLING):
+                handler(obj)
+
+    def press(self, pin: int, hold_s=0.05) -> None:
+        """
+        push a pulled up button to ground and release it
+        """
+        self.set_level(pin, 0)
+        time.sleep(hold_s)
+        self.set_level(pin, 1)
+
+    def adc_read(self, pin: int) -> float:
+        v = self.adc_v[pin]
+        return v(time.monotonic()) if callable(v) else v
+
+    def machine(self) -> types.ModuleType:
+        board = self
+        mod = types.ModuleType('machine')
+        mod.Pin = type('Pin', (Pin,), {'board': board})
+        mod.ADC = type('ADC', (ADC,), {'board': board})
+        mod.UART = type('UART', (UART,), {'board': board})
+        mod.I2C = type('I2C', (I2C,), {'board': board})
+        mod.Timer = type('Timer', (Timer,), {'board': board})
+        mod.mem32 = Mem32(board)
+        mod.disable_irq = lambda: board.lock.acquire() and 0
+        mod.enable_irq = lambda state=0: board.lock.release()
+        mod.freq = lambda *args: 125000000
+        mod.unique_id = lambda: board.name.encode()
+        mod.reset = mod.soft_reset = lambda: None
+        return mod
+
+
+def link(upstream: Board, downstream: Board) -> None:
+    """
+    wire upstream board UART1 (downstream port) to downstream board UART0 (upstream port)
+    """
+    upstream.tx[1] = downstream.rx[0]
+    downstream.tx[0] = upstream.rx[1]
+
+
+class Pin(object):
+    board = None
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    ALT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=None, pull=None, value=None) -> None:
+        self.id = id
+        if mode is not None:
+            self.board.modes[id] = mode
+        if pull == self.PULL_UP and mode == self.IN:
+            self.board.levels[id] = 1
+        if value is not None:
+            self.value(value)
+
+    def value(self, v=None):
+        if v is None:
+            return self.board.levels[self.id]
+        self.board.set_level(self.id, 1 if v else 0)
+
+    def on(self) -> None:
+        self.value(1)
+
+    def off(self) -> None:
+        self.value(0)
+
+    def toggle(self) -> None:
+        self.value(not self.value())
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False) -> None:
+        self.board.irqs[self.id] = (trigger, handler, self)
+
+    __call__ = value
+
+
+class ADC(object):
+    board = None
+    VREF = 3.3
+
+    def __init__(self, pin) -> None:
+        self.pin = pin.id if isinstance(pin, Pin) else pin
+
+    def read_u16(self) -> int:
+        return max(0, min(0xFFFF, int(self.board.adc_read(self.pin) / self.VREF * 65536)))
+
+
+class UART(object):
+    board = None
+
+    def __init__(self, id, baudrate=9600, tx=None, rx=None, **kwargs) -> None:
+        self.id = id
+        self.baudrate = baudrate
+        self.board.uarts[id] = self
+
+    def init(self, baudrate=None, **kwargs) -> None:
+        if baudrate is not None:
+            self.baudrate = baudrate
+
+    def deinit(self) -> None:
+        pass
+
+    def write(self, buf) -> int:
+        data = bytes(buf)
+        self.board.tx[self.id].send(data, self.baudrate)
+        return len(data)
+
+    def any(self) -> int:
+        return self.board.rx[self.id].available()
+
+    def next_arrival(self):
+        return self.board.rx[self.id].next_arrival()
+
+    def read(self, nbytes=None):
+        data = self.board.rx[self.id].recv(nbytes if nbytes is not None else 1 << 16, self.baudrate)
+        return data or None
+
+    def readinto(self, buf, nbytes=None):
+        data = self.board.rx[self.id].recv(len(buf) if nbytes is None else nbytes, self.baudrate)
+        if not data:
+            return None
+        buf[:len(data)] = data
+        return len(data)
+
+    def flush(self) -> None:
+        while time.monotonic() < self.board.tx[self.id].busy_until:
+            time.sleep(0.0001)
+
+    def txdone(self) -> bool:
+        return time.monotonic() >= self.board.tx[self.id].busy_until
+
+
+class I2C(object):
+    board = None
+
+    def __init__(self, id, scl=None, sda=None, freq=400000) -> None:
+        self.id = id
+        self.freq = freq
+
+    def _dev(self, addr: int) -> USB2514B:
+        if addr != self.board.hub.ADDR:
+            raise OSError(5)
+        return self.board.hub
+
+    def writeto(self, addr: int, buf, stop=True) -> int:
+        self._dev(addr).write(bytes(buf))
+        return len(buf)
+
+    def readfrom(self, addr: int, nbytes: int, stop=True) -> bytes:
+        return self._dev(addr).read(nbytes)
+
+    def readfrom_into(self, addr: int, buf, stop=True) -> None:
+        buf[:] = self._dev(addr).read(len(buf))
+
+    def scan(self) -> list:
+        return [] if self.board.hub.in_reset else [self.board.hub.ADDR]
+
+
+class Timer(object):
+    board = None
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, mode=PERIODIC, freq=None, period=None, callback=None) -> None:
+        self.th = None
+        self.running = False
+        if callback is not None:
+            self.init(mode=mode, freq=freq, period=period, callback=callback)
+
+    def init(self, mode=PERIODIC, freq=None, period=None, callback=None) -> None:
+        self.deinit()
+        if not self.board.timers and mode == self.PERIODIC:
+            return
+        self.interval = 1 / freq if freq else (period or 1000) / 1000
+        self.mode = mode
+        self.callback = callback
+        self.running = True
+        self.board.timer_objs.append(self)
+        self.th = threading.Thread(target=self._run, daemon=True)
+        self.th.start()
+
+    def _run(self) -> None:
+        nxt = time.monotonic()
+        while self.running:
+            nxt += self.interval
+            time.sleep(max(0.0, nxt - time.monotonic()))
+            if self.running:
+                self.callback(self)
+            if self.mode == self.ONE_SHOT:
+                self.running = False
+
+    def deinit(self) -> None:
+        self.running = False
+
+
+class Mem32(object):
+    """
+    SIO GPIO registers of machine.mem32
+    """
+    def __init__(self, board: Board) -> None:
+        self.board = board
+
+    def __getitem__(self, addr: int) -> int:
+        if addr in (SIO_GPIO_IN, SIO_GPIO_OUT):
+            with self.board.lock:
+                return sum(level << pin for pin, level in enumerate(self.board.levels))
+        raise ValueError(f'mem32 address {addr:#x} not simulated')
+
+    def __setitem__(self, addr: int, mask: int) -> None:
+        with self.board.lock:  # all pins of one register write change together
+            self._write(addr, mask)
+
+    def _write(self, addr: int, mask: int) -> None:
+        levels = self.board.levels
+        for pin in range(GPIO_COUNT):
+            if not mask & (1 << pin) and addr != SIO_GPIO_OUT:
+                continue
+            if addr == SIO_GPIO_OUT_SET:
+                level = 1
+            elif addr == SIO_GPIO_OUT_CLR:
+                level = 0
+            elif addr == SIO_GPIO_OUT_XOR:
+                level = levels[pin] ^ 1
+            elif addr == SIO_GPIO_OUT:
+                level = (mask >> pin) & 1
+            else:
+                raise ValueError(f'mem32 address {addr:#x} not simulated')
+            self.board.set_level(pin, level)
@@ -0,0 +1,163 @@
+"""
+MicroPython runtime module stand-ins: time ticks, _thread, micropython.schedule, select.poll, gc, ucollections
+"""
+import collections
+import gc as _gc
+import threading
+import time as _time
+import tracemalloc
+import types
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALF = TICKS_PERIOD // 2
+SCHED_DEPTH = 8  # MicroPython scheduler queue depth
+POLLIN = 0x0001
+POLLOUT = 0x0004
+HEAP_SIZE = 192 * 1024  # rp2 MicroPython heap, reported by gc shim
+
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    mod = types.ModuleType(name)
+    mod.__dict__.update(attrs)
+    return mod
+
+
+# time
+def ticks_ms() -> int:
+    return (_time.monotonic_ns() // 1000000) & TICKS_MAX
+
+
+def ticks_us() -> int:
+    return (_time.monotonic_ns() // 1000) & TICKS_MAX
+
+
+def ticks_cpu() -> int:
+    return ticks_us()
+
+
+def ticks_diff(new: int, old: int) -> int:
+    return ((new - old + TICKS_HALF) & TICKS_MAX) - TICKS_HALF
+
+
+def ticks_add(ticks: int, delta: int) -> int:
+    return (ticks + delta) & TICKS_MAX
+
+
+def sleep_ms(ms: int) -> None:
+    _time.sleep(ms / 1000)
+
+
+def sleep_us(us: int) -> None:
+    _time.sleep(us / 1000000)
+
+
+time = _module('time', ticks_ms=ticks_ms, ticks_us=ticks_us, ticks_cpu=ticks_cpu, ticks_diff=ticks_diff,
+               ticks_add=ticks_add, sleep_ms=sleep_ms, sleep_us=sleep_us, sleep=_time.sleep, time=_time.time,
+               time_ns=_time.time_ns, localtime=_time.localtime)
+
+# _thread, cores are threads
+_thread = _module('_thread', allocate_lock=threading.Lock, get_ident=threading.get_ident,
+                  start_new_thread=lambda func, args, kwargs=None: threading.Thread(
+                      target=func, args=args, kwargs=kwargs or {}, daemon=True).start())
+
+ucollections = _module('ucollections', namedtuple=collections.namedtuple, deque=collections.deque,
+                       OrderedDict=collections.OrderedDict)
+
+
+def _mem_free() -> int:
+    """
+    HEAP_SIZE less memory traced by tracemalloc (not tracing: whole heap free). Host allocations only approximate
+    MicroPython heap use
+    """
+    used = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+    return max(0, HEAP_SIZE - used)
+
+
+gc = _module('gc', collect=_gc.collect, enable=_gc.enable, disable=_gc.disable, isenabled=_gc.isenabled,
+             mem_free=_mem_free, mem_alloc=lambda: HEAP_SIZE - _mem_free(), threshold=lambda *args: -1)
+
+
+class Scheduler(object):
+    """
+    micropython.schedule queue of one board, drained by a thread standing in for the main core between bytecodes
+    """
+    def __init__(self, name: str) -> None:
+        self.q = collections.deque()
+        self.cond = threading.Condition()
+        self.running = True
+        self.errors = []  # exceptions raised by scheduled callbacks
+        self.th = threading.Thread(target=self._run, name=f'{name}-sched', daemon=True)
+        self.th.start()
+
+    def schedule(self, func, arg) -> None:
+        with self.cond:
+            if len(self.q) >= SCHED_DEPTH:
+                raise RuntimeError('schedule queue full')
+            self.q.append((func, arg))
+            self.cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self.cond:
+                while self.running and not self.q:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                func, arg = self.q.popleft()
+            try:
+                func(arg)
+            except Exception as e:
+                self.errors.append(e)
+
+    def stop(self) -> None:
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+
+def micropython(sched: Scheduler) -> types.ModuleType:
+    return _module('micropython', schedule=sched.schedule, const=lambda x: x,
+                   alloc_emergency_exception_buf=lambda size: None, mem_info=lambda *args: None)
+
+
+class Poll(object):
+    """
+    select.poll over simulated UARTs of one board. Sleeps on the board rx condition until a byte has arrived, its
+    arrival time accounting for baud rate
+    """
+    def __init__(self) -> None:
+        self.objs = {}
+
+    def register(self, obj, mask=POLLIN) -> None:
+        self.objs[obj] = mask
+
+    def unregister(self, obj) -> None:
+        self.objs.pop(obj, None)
+
+    def modify(self, obj, mask) -> None:
+        self.objs[obj] = mask
+
+    def poll(self, timeout=-1) -> list:
+        if not self.objs:
+            return []
+        cond = next(iter(self.objs)).board.rx_cond
+        deadline = None if timeout is None or timeout < 0 else _time.monotonic() + timeout / 1000
+        with cond:
+            while True:
+                ready = [(obj, POLLIN) for obj, mask in self.objs.items() if mask & POLLIN and obj.any()]
+                if ready:
+                    return ready
+                now = _time.monotonic()
+                wake = [t for t in (obj.next_arrival() for obj in self.objs) if t is not None]
+                if deadline is not None:
+                    wake.append(deadline)
+                    if now >= deadline:
+                        return []
+                cond.wait(max(0.0, min(wake) - now) if wake else None)
+
+    def ipoll(self, timeout=-1, flags=0):
+        return iter(self.poll(timeout))
+
+
+select = _module('select', poll=Poll, POLLIN=POLLIN, POLLOUT=POLLOUT, POLLERR=0x0008, POLLHUP=0x0010)
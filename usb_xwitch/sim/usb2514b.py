@@ -0,0 +1,75 @@
+"""
+USB2514B SMBus register model. Block write [reg, count, data...], pointer write [reg] then block read returning
+[count, data...]. Registers return to power-on values on RESET_N, configuration latches on STAT_CMD attach and further
+writes are NACKed until next reset.
+"""
+EIO = 5
+MAX_BLOCK = 32
+STAT_CMD = 0xFF
+STAT_ATTACH = 0x01
+PORT_DISABLE_SELF = 0x0A
+
+
+class USB2514B(object):
+    ADDR = 0x2C
+
+    def __init__(self, por_image: bytes) -> None:
+        self.por = bytes(por_image)
+        self.regs = bytearray(self.por)
+        self.ptr = 0
+        self.in_reset = False
+        self.attached = False
+        self.latched = None  # register map at attach, what the hub runs with
+        self.resets = 0
+        self.writes = 0  # SMBus write transactions
+        self.reads = 0
+        self.bytes = 0  # bytes on the bus, address bytes excluded
+
+    def reset(self, asserted: bool) -> None:
+        """
+        RESET_N pin. NACKs everything while asserted, power-on registers once released
+        """
+        if asserted:
+            self.in_reset = True
+            return
+        if self.in_reset:
+            self.regs[:] = self.por
+            self.attached = False
+            self.latched = None
+            self.resets += 1
+        self.in_reset = False
+
+    def write(self, buf: bytes) -> None:
+        if self.in_reset:
+            raise OSError(EIO)
+        self.writes += 1
+        self.bytes += len(buf)
+        if len(buf) == 1:  # register pointer for following block read
+            self.ptr = buf[0]
+            return
+        reg, count, data = buf[0], buf[1], bytes(buf[2:])
+        if count != len(data) or not 0 < count <= MAX_BLOCK or reg + count > len(self.regs):
+            raise OSError(EIO)
+        if self.attached:  # configuration latched
+            raise OSError(EIO)
+        self.regs[reg:reg + count] = data
+        if reg + count > STAT_CMD and self.regs[STAT_CMD] & STAT_ATTACH:
+            self.attached = True
+            self.latched = bytes(self.regs)
+
+    def read(self, n: int) -> bytes:
+        if self.in_reset:
+            raise OSError(EIO)
+        self.reads += 1
+        self.bytes += n
+        data = bytes(self.regs[self.ptr:self.ptr + n - 1])
+        return bytes([n - 1]) + data + bytes(n - 1 - len(data))
+
+    def ports_enabled(self):
+        """
+        downstream ports 1 - 4 enabled as the attached hub runs them, None when not attached
+        """
+        if self.latched is None:
+            return None
+        mask = self.latched[PORT_DISABLE_SELF]
+        return [not mask & (1 << (i + 1)) for i in range(4)]